@@ -0,0 +1,133 @@
+import gzip
+import hashlib
+import mimetypes
+import threading
+from pathlib import Path
+from flask import Response, abort, request
+from werkzeug.security import safe_join
+
+try:
+    import brotli  # optional; gzip-only when missing
+except ImportError:  # pragma: no cover
+    brotli = None
+
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+def _accepts(encoding: str) -> bool:
+    return request.accept_encodings[encoding] > 0
+
+def _compressible(mimetype: str | None) -> bool:
+    return bool(mimetype) and mimetype.startswith(COMPRESSIBLE_TYPES)
+
+class _Asset:
+    def __init__(self, path: Path):
+        st = path.stat()
+        raw = path.read_bytes()
+        self.mtime = st.st_mtime_ns
+        self.digest = hashlib.sha256(raw).hexdigest()[:12]
+        self.mimetype = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+        self.variants = {"identity": raw}
+        if _compressible(self.mimetype):
+            self.variants["gzip"] = gzip.compress(raw, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(raw, quality=11)
+
+class StaticAssets:
+    """Build-free static pipeline.
+
+    url_for("static", filename=...) gains a ?v=<content hash> so those URLs can be
+    cached forever; gzip/brotli variants are compressed once per file version and
+    kept in memory. JSON responses over `min_size` are compressed on the fly.
+    """
+
+    def __init__(self, app=None, *, min_size=1024, level=6):
+        self.min_size = min_size
+        self.level = level
+        self._assets: dict[str, _Asset] = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        app.url_defaults(self._url_defaults)
+        app.view_functions["static"] = self.send_static
+        app.after_request(self._compress_response)
+        # Warm up so the first page load doesn't pay for brotli -q 11
+        for p in Path(self.static_folder).rglob("*"):
+            if p.is_file():
+                self._get(p.relative_to(self.static_folder).as_posix())
+
+    def _get(self, filename: str) -> _Asset | None:
+        path = safe_join(self.static_folder, filename)
+        if path is None:
+            return None
+        p = Path(path)
+        try:
+            mtime = p.stat().st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if not p.is_file():
+            return None
+
+        asset = self._assets.get(filename)
+        if asset is None or asset.mtime != mtime:  # new file or edited in place (dev mount)
+            with self._lock:
+                asset = _Asset(p)
+                self._assets[filename] = asset
+        return asset
+
+    def _url_defaults(self, endpoint, values):
+        if endpoint != "static" or "v" in values:
+            return
+        asset = self._get(values.get("filename") or "")
+        if asset is not None:
+            values["v"] = asset.digest
+
+    def send_static(self, filename: str):
+        asset = self._get(filename)
+        if asset is None:
+            abort(404)
+
+        encoding = "identity"
+        for enc in ("br", "gzip"):
+            if enc in asset.variants and _accepts(enc):
+                encoding = enc
+                break
+
+        resp = Response(asset.variants[encoding], mimetype=asset.mimetype)
+        if encoding != "identity":
+            resp.headers["Content-Encoding"] = encoding
+        if len(asset.variants) > 1:
+            resp.vary.add("Accept-Encoding")
+        resp.set_etag(f"{asset.digest}-{encoding}")
+
+        if request.args.get("v") == asset.digest:
+            resp.headers["Cache-Control"] = IMMUTABLE
+        else:
+            # Unversioned or stale URL: let the browser revalidate via ETag
+            resp.headers["Cache-Control"] = "no-cache"
+        return resp.make_conditional(request)
+
+    def _compress_response(self, resp: Response):
+        if (resp.direct_passthrough or resp.is_streamed
+                or resp.status_code < 200 or resp.status_code in (204, 304)
+                or "Content-Encoding" in resp.headers
+                or resp.mimetype != "application/json"):
+            return resp
+
+        body = resp.get_data()
+        if len(body) < self.min_size:
+            return resp
+
+        if brotli is not None and _accepts("br"):
+            resp.set_data(brotli.compress(body, quality=min(self.level, 11)))
+            resp.headers["Content-Encoding"] = "br"
+        elif _accepts("gzip"):
+            resp.set_data(gzip.compress(body, compresslevel=self.level))
+            resp.headers["Content-Encoding"] = "gzip"
+        else:
+            return resp
+        resp.vary.add("Accept-Encoding")
+        return resp
@@ -40,13 +40,15 @@ class BeszelClient:
     def _headers(self):
         return {"Accept": "application/json", "Authorization": f"Bearer {self._get_token()}"}
 
-    def list_records(self, collection: str, *, per_page=200, page=1, filter_str=None, sort=None):
+    def list_records(self, collection: str, *, per_page=200, page=1, filter_str=None, sort=None, fields=None):
         url = f"{self.base_url}/api/collections/{collection}/records"
         params = {"perPage": per_page, "page": page}
         if filter_str:
             params["filter"] = filter_str
         if sort:
             params["sort"] = sort
+        if fields:
+            params["fields"] = fields
         r = requests.get(url, params=params, headers=self._headers(), timeout=self.timeout)
         r.raise_for_status()
         return r.json()
@@ -55,3 +57,19 @@ class BeszelClient:
         data = self.list_records(collection, per_page=1, page=1, filter_str=filter_str, sort=sort)
         items = data.get("items", [])
         return items[0] if items else None
+
+    def list_all(self, collection: str, *, filter_str=None, sort=None, fields=None, per_page=500):
+        items, page = [], 1
+        while True:
+            data = self.list_records(collection, per_page=per_page, page=page,
+                                     filter_str=filter_str, sort=sort, fields=fields)
+            items.extend(data.get("items", []))
+            if page >= int(data.get("totalPages") or 1):
+                return items
+            page += 1
+
+    def get_record(self, collection: str, record_id: str):
+        url = f"{self.base_url}/api/collections/{collection}/records/{record_id}"
+        r = requests.get(url, headers=self._headers(), timeout=self.timeout)
+        r.raise_for_status()
+        return r.json()
@@ -15,6 +15,31 @@ def getenv_int(name: str, default: int) -> int:
     except Exception:
         return default
 
+def beszel_sources() -> dict[str, dict[str, str]]:
+    """Named Beszel hubs.
+
+    BESZEL_BASE_URL is the hub called "default". BESZEL_SOURCES adds more as
+    "site-a=http://a:8090,site-b=http://b:8090"; each uses the beszel_<name>_email /
+    beszel_<name>_password secrets, falling back to the shared beszel_email / beszel_password.
+    """
+    email = read_secret("beszel_email") or ""
+    password = read_secret("beszel_password") or ""
+    sources = {}
+    base = os.getenv("BESZEL_BASE_URL", "").rstrip("/")
+    if base:
+        sources["default"] = {"base_url": base, "email": email, "password": password}
+    for part in os.getenv("BESZEL_SOURCES", "").split(","):
+        name, sep, url = part.partition("=")
+        name, url = name.strip(), url.strip().rstrip("/")
+        if not (sep and name and url):
+            continue
+        sources[name] = {
+            "base_url": url,
+            "email": read_secret(f"beszel_{name}_email") or email,
+            "password": read_secret(f"beszel_{name}_password") or password,
+        }
+    return sources
+
 class Settings:
     DB_PATH = os.getenv("DASH_DB_PATH", "/data/dashboard.db")
 
@@ -24,12 +49,71 @@ class Settings:
     BESZEL_BASE_URL = os.getenv("BESZEL_BASE_URL", "").rstrip("/")
     BESZEL_EMAIL = read_secret("beszel_email") or ""
     BESZEL_PASSWORD = read_secret("beszel_password") or ""
+    BESZEL_SOURCES = beszel_sources()
+    BESZEL_TIMEOUT_SECONDS = getenv_int("DASH_BESZEL_TIMEOUT_SECONDS", 3)
+    # Per-hub budget for one metrics round; a slower hub is reported and skipped
+    BESZEL_HUB_DEADLINE_SECONDS = getenv_int("DASH_BESZEL_HUB_DEADLINE_SECONDS", 8)
+    # Probe DNS cache: TTL used when the record TTL isn't known, failure TTL, and how long
+    # an expired answer may be served while the resolver is failing
+    DNS_TTL_SECONDS = getenv_int("DASH_DNS_TTL_SECONDS", 60)
+    DNS_NEGATIVE_TTL_SECONDS = getenv_int("DASH_DNS_NEGATIVE_TTL_SECONDS", 10)
+    DNS_MAX_STALE_SECONDS = getenv_int("DASH_DNS_MAX_STALE_SECONDS", 600)
+
+    # Services on a Beszel-offline host (or under a down parent) are only canary-probed this often
+    CANARY_SECONDS = getenv_int("DASH_CANARY_SECONDS", 60)
+    # How often to re-list Beszel systems/containers to detect renames or recreated containers
+    BESZEL_INDEX_TTL_SECONDS = getenv_int("DASH_BESZEL_INDEX_TTL_SECONDS", 300)
 
     DOZZLE_BASE_URL = os.getenv("DOZZLE_BASE_URL", "").rstrip("/")
+    # Upstream log stream for the inline preview. {host} and {container} are Dozzle's ids, looked up
+    # by container name from Dozzle's event stream; DOZZLE_HOST is the fallback when that fails
+    DOZZLE_HOST = os.getenv("DOZZLE_HOST", "localhost")
+    DOZZLE_STREAM_PATH = os.getenv(
+        "DOZZLE_STREAM_PATH", "/api/hosts/{host}/containers/{container}/logs/stream?stdout=1&stderr=1"
+    )
+    LOG_TAIL_LINES = getenv_int("DASH_LOG_TAIL_LINES", 500)
+    LOG_TAIL_MAX_LINE_BYTES = getenv_int("DASH_LOG_TAIL_MAX_LINE_BYTES", 4096)
+    LOG_TAIL_IDLE_SECONDS = getenv_int("DASH_LOG_TAIL_IDLE_SECONDS", 30)
+    LOG_TAIL_MAX_STREAM_LINES = getenv_int("DASH_LOG_TAIL_MAX_STREAM_LINES", 5000)
 
     POLL_HEALTH_SECONDS = getenv_int("DASH_POLL_HEALTH_SECONDS", 10)
     POLL_METRICS_SECONDS = getenv_int("DASH_POLL_METRICS_SECONDS", 10)
 
+    # "rows" = one CheckResult per probe, "intervals" = run-length encoded StateInterval rows
+    HISTORY_MODE = os.getenv("DASH_HISTORY_MODE", "rows").strip().lower()
+
+    # Where probe/metric samples go: "sqlite" (check_results / metrics_snapshots rows) or
+    # "segments" (append-only per-service files under SERIES_DIR; SQLite keeps config only)
+    TS_BACKEND = os.getenv("DASH_TS_BACKEND", "sqlite").strip().lower()
+    SERIES_DIR = os.getenv("DASH_SERIES_DIR", str(Path(DB_PATH).parent / "series"))
+    SERIES_SEAL_ROWS = getenv_int("DASH_SERIES_SEAL_ROWS", 1024)
+    SERIES_COMPACT_SECONDS = getenv_int("DASH_SERIES_COMPACT_SECONDS", 300)
+
+    # Latest-state table shared by all workers (memory-mapped; /dev/shm keeps it off disk)
+    SNAPSHOT_PATH = os.getenv(
+        "DASH_SNAPSHOT_PATH",
+        "/dev/shm/watchforge.snapshot" if os.path.isdir("/dev/shm")
+        else str(Path(DB_PATH).parent / "watchforge.snapshot"),
+    )
+    SNAPSHOT_CAPACITY = getenv_int("DASH_SNAPSHOT_CAPACITY", 512)
+    # Snapshot older than this many poll periods is ignored and the API polls inline
+    SNAPSHOT_MAX_AGE_POLLS = getenv_int("DASH_SNAPSHOT_MAX_AGE_POLLS", 3)
+    # Copy of the snapshot written on every round, reloaded after a restart so the dashboard
+    # shows the last known state (marked stale) instead of blanks until the first rounds finish
+    SNAPSHOT_PERSIST_PATH = os.getenv("DASH_SNAPSHOT_PERSIST_PATH", str(Path(DB_PATH).parent / "watchforge.last-snapshot"))
+    WARM_START_GRACE_SECONDS = getenv_int("DASH_WARM_START_GRACE_SECONDS", 300)
+    # A probe/metrics round newer than this is reused instead of recomputed
+    MIN_RECOMPUTE_SECONDS = getenv_int("DASH_MIN_RECOMPUTE_SECONDS", 2)
+
+    # JSON responses at least this large are gzip/brotli compressed
+    COMPRESS_MIN_BYTES = getenv_int("DASH_COMPRESS_MIN_BYTES", 1024)
+
+    # On-demand sampling profiler (switched on at runtime from /api/profiling)
+    PROFILE_DIR = os.getenv("DASH_PROFILE_DIR", str(Path(DB_PATH).parent / "profiles"))
+    PROFILE_MAX = getenv_int("DASH_PROFILE_MAX", 50)
+    PROFILE_SAMPLE_PCT = getenv_int("DASH_PROFILE_SAMPLE_PCT", 10)
+    PROFILE_INTERVAL_MS = getenv_int("DASH_PROFILE_INTERVAL_MS", 5)
+
     WARN_PCT = getenv_int("DASH_WARN_PCT", 80)
     DANGER_PCT = getenv_int("DASH_DANGER_PCT", 95)
 
@@ -1,10 +1,40 @@
+import sqlite3
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import DeclarativeBase
 from datetime import datetime
 
 db = SQLAlchemy()
 
+@event.listens_for(Engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _record):
+    """WAL so a long streamed export (one read transaction) doesn't lock out the poll jobs' commits."""
+    if isinstance(dbapi_conn, sqlite3.Connection):
+        cur = dbapi_conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute("PRAGMA busy_timeout=5000")
+        cur.close()
+
+def ensure_columns(table: str, columns: dict[str, str]):
+    """create_all() never alters existing tables; add columns introduced since the DB was created."""
+    insp = db.inspect(db.engine)
+    if not insp.has_table(table):
+        return
+    have = {c["name"] for c in insp.get_columns(table)}
+    for name, ddl in columns.items():
+        if name not in have:
+            db.session.execute(db.text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+    db.session.commit()
+
+def ensure_indexes(*models):
+    """Like ensure_columns, for indexes declared after the table already existed."""
+    for model in models:
+        for index in model.__table__.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
 class AppSetting(db.Model):
     __tablename__ = "app_settings"
     key = db.Column(db.String(64), primary_key=True)
@@ -22,6 +52,7 @@ class Service(db.Model):
     beszel_host = db.Column(db.String(128), nullable=True)       # "arborlon"
     beszel_container = db.Column(db.String(128), nullable=True)  # "immich_server"
     dozzle_container = db.Column(db.String(128), nullable=True)  # defaults to beszel_container
+    depends_on = db.Column(db.String(64), nullable=True)         # parent service slug, e.g. "postgres"
     enabled = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -42,7 +73,11 @@ class CheckResult(db.Model):
     ok = db.Column(db.Boolean, default=False)
     status_code = db.Column(db.Integer, nullable=True)
     latency_ms = db.Column(db.Integer, nullable=True)
-    error = db.Column(db.Text, nullable=True)
+    dns_ms = db.Column(db.Integer, nullable=True)  # time spent resolving the host (~0 on a cache hit)
+    error = db.Column(db.Text, nullable=True)       # "dns: ..." when the name didn't resolve
+
+    # newest row per service (warm start) without scanning the whole table
+    __table_args__ = (db.Index("ix_check_results_service_checked", "service_id", "checked_at"),)
 
 class MetricsSnapshot(db.Model):
     __tablename__ = "metrics_snapshots"
@@ -60,6 +95,8 @@ class MetricsSnapshot(db.Model):
     ctr_uptime = db.Column(db.String(64), nullable=True)  # "Up 7 days"
     ctr_health = db.Column(db.Integer, nullable=True)
 
+    __table_args__ = (db.Index("ix_metrics_snapshots_service_checked", "service_id", "checked_at"),)
+
 class User(db.Model):
     __tablename__ = "users"
 
@@ -83,3 +120,32 @@ class Theme(db.Model):
     created_by_user_id = db.Column(db.Integer, db.ForeignKey("users.id"))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class StateInterval(db.Model):
+    # Run-length encoded check history: one row per stretch of identical probe results
+    __tablename__ = "state_intervals"
+    id = db.Column(db.Integer, primary_key=True)
+    service_id = db.Column(db.Integer, db.ForeignKey("services.id"), index=True)
+    ok = db.Column(db.Boolean, default=False)
+    status_code = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    started_at = db.Column(db.Integer, index=True)  # epoch seconds of first probe
+    ended_at = db.Column(db.Integer, index=True)    # epoch seconds of last probe
+    probe_count = db.Column(db.Integer, default=1)
+
+    latency_min_ms = db.Column(db.Integer, nullable=True)
+    latency_max_ms = db.Column(db.Integer, nullable=True)
+    latency_sum_ms = db.Column(db.Integer, default=0)
+    latency_count = db.Column(db.Integer, default=0)
+
+    __table_args__ = (db.Index("ix_state_intervals_service_ended", "service_id", "ended_at"),)
+
+class BeszelResolution(db.Model):
+    # Cached Service -> Beszel record ids, rebuilt when services or Beszel inventory change
+    __tablename__ = "beszel_resolutions"
+    service_id = db.Column(db.Integer, db.ForeignKey("services.id"), primary_key=True)
+    source = db.Column(db.String(64), nullable=True)  # Beszel hub name
+    system_id = db.Column(db.String(32), nullable=True)
+    container_id = db.Column(db.String(32), nullable=True)
+    error = db.Column(db.Text, nullable=True)  # why it didn't resolve, for diagnostics
+    resolved_at = db.Column(db.Integer, nullable=True)
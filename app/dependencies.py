@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Any
+
+from .db import Service
+
+HOST_UNREACHABLE = "down (host unreachable)"
+
+def order_by_dependency(services: list[Service]) -> list[Service]:
+    """Parents before children; unknown parents and cycles are treated as no dependency."""
+    by_slug = {s.slug: s for s in services}
+    out, state = [], {}  # state: 1 = visiting, 2 = done
+
+    def visit(s: Service):
+        if state.get(s.slug) == 2:
+            return
+        state[s.slug] = 1
+        parent = by_slug.get(s.depends_on or "")
+        if parent is not None and state.get(parent.slug) != 1:
+            visit(parent)
+        state[s.slug] = 2
+        out.append(s)
+
+    for s in services:
+        visit(s)
+    return out
+
+class HostStates:
+    """Latest Beszel system status per (hub, system id), fed by the metrics round."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states: dict[tuple[str, str], tuple[str, float]] = {}
+
+    def update(self, source: str, statuses: dict[str, str], at: float | None = None):
+        at = at or time.time()
+        with self._lock:
+            for system_id, status in statuses.items():
+                self._states[(source, system_id)] = (status, at)
+
+    def is_offline(self, source: str | None, system_id: str | None, *, max_age: float) -> bool:
+        if not (source and system_id):
+            return False
+        with self._lock:
+            status, at = self._states.get((source, system_id), (None, 0.0))
+        return status == "down" and (time.time() - at) <= max_age
+
+class ProbeSuppressor:
+    """Decides which services to skip probing because their host or parent is down.
+
+    Suppressed services in the same group (host or parent) get one canary probe
+    every `canary_seconds`; if it succeeds the whole group is probed again.
+    """
+
+    def __init__(self, host_states: HostStates, *, canary_seconds=60, host_state_max_age=60):
+        self.host_states = host_states
+        self.canary_seconds = canary_seconds
+        self.host_state_max_age = host_state_max_age
+        self._last_canary: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def begin_round(self) -> "SuppressionRound":
+        return SuppressionRound(self)
+
+class SuppressionRound:
+    def __init__(self, owner: ProbeSuppressor):
+        self.owner = owner
+        self.results: dict[str, dict[str, Any]] = {}
+        self._lifted: set[str] = set()
+        self._canaried: set[str] = set()
+
+    def reason(self, s: Service, res: dict[str, Any] | None) -> tuple[str, str] | None:
+        """(group key, error text) if `s` should not be probed this round."""
+        res = res or {}
+        if self.owner.host_states.is_offline(res.get("source"), res.get("system_id"),
+                                             max_age=self.owner.host_state_max_age):
+            return f'host:{res["source"]}/{res["system_id"]}', HOST_UNREACHABLE
+        parent = self.results.get(s.depends_on or "")
+        if parent is not None and not parent["ok"]:
+            return f"parent:{s.depends_on}", f"down (depends on {s.depends_on})"
+        return None
+
+    def should_probe(self, key: str) -> bool:
+        if key in self._lifted:
+            return True
+        if key in self._canaried:
+            return False
+        now = time.time()
+        with self.owner._lock:
+            if now - self.owner._last_canary.get(key, 0.0) < self.owner.canary_seconds:
+                return False
+            self.owner._last_canary[key] = now
+        self._canaried.add(key)
+        return True
+
+    def record(self, s: Service, key: str | None, r: dict[str, Any]):
+        self.results[s.slug] = r
+        if key and r["ok"]:
+            # canary came back: the rest of the group gets real probes from here on
+            self._lifted.add(key)
+            with self.owner._lock:
+                self.owner._last_canary.pop(key, None)
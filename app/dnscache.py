@@ -0,0 +1,168 @@
+import ipaddress
+import socket
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util import connection
+
+try:
+    import dns.resolver  # optional; gives real record TTLs
+except ImportError:  # pragma: no cover
+    dns = None
+
+class DNSError(Exception):
+    pass
+
+class _Entry:
+    __slots__ = ("addrs", "error", "ttl", "expires_at", "stale_until", "refreshing")
+
+    def __init__(self, addrs, error, ttl, expires_at, stale_until):
+        self.addrs = addrs
+        self.error = error
+        self.ttl = ttl
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.refreshing = False
+
+class DNSCache:
+    """Hostname -> addresses for the probe engine.
+
+    Positive answers live for the record TTL (when dnspython is available,
+    clamped to [min_ttl, max_ttl]) or `default_ttl`; failures are cached for
+    `negative_ttl`. Entries close to expiry are refreshed in the background, and
+    if the resolver is down an expired answer is served for up to `max_stale`
+    seconds rather than reporting every service behind it as an outage.
+    """
+
+    def __init__(self, *, default_ttl=60, min_ttl=5, max_ttl=3600, negative_ttl=10,
+                 max_stale=600, refresh_ahead=0.8):
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.max_stale = max_stale
+        self.refresh_ahead = refresh_ahead
+        self._entries: dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._pools = None
+
+    def _query(self, host: str) -> tuple[list[str], float]:
+        """(addresses, ttl) straight from the resolver; raises DNSError."""
+        if dns is not None:
+            addrs, ttl = [], None
+            for rtype in ("A", "AAAA"):
+                try:
+                    ans = dns.resolver.resolve(host, rtype, search=True, lifetime=2.0)
+                except Exception:
+                    continue
+                addrs.extend(r.to_text() for r in ans)
+                ttl = ans.rrset.ttl if ttl is None else min(ttl, ans.rrset.ttl)
+            if addrs:
+                return addrs, min(self.max_ttl, max(self.min_ttl, ttl))
+            # fall through: /etc/hosts, mDNS and friends only work through the system resolver
+
+        try:
+            infos = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise DNSError(f"{host}: {e.strerror or e}") from e
+        addrs = list(dict.fromkeys(info[4][0] for info in infos))
+        if not addrs:
+            raise DNSError(f"{host}: no addresses")
+        return addrs, self.default_ttl
+
+    def _fill(self, host: str) -> _Entry:
+        now = time.monotonic()
+        try:
+            addrs, ttl = self._query(host)
+            entry = _Entry(addrs, None, ttl, now + ttl, now + ttl + self.max_stale)
+        except DNSError as e:
+            with self._lock:
+                old = self._entries.get(host)
+            if old is not None and old.addrs and now < old.stale_until:
+                old.refreshing = False
+                old.expires_at = now + self.negative_ttl  # retry soon, keep serving stale
+                return old
+            entry = _Entry(None, str(e), self.negative_ttl, now + self.negative_ttl, now + self.negative_ttl)
+        with self._lock:
+            self._entries[host] = entry
+        return entry
+
+    def _refresh_async(self, host: str, entry: _Entry):
+        with self._lock:
+            if entry.refreshing:
+                return
+            entry.refreshing = True
+        threading.Thread(target=self._fill, args=(host,), name=f"dns-{host}", daemon=True).start()
+
+    def resolve(self, host: str) -> tuple[list[str], bool]:
+        """(addresses, from_cache). Raises DNSError for (cached) failures."""
+        try:
+            ipaddress.ip_address(host.strip("[]"))
+            return [host.strip("[]")], True
+        except ValueError:
+            pass
+
+        host = host.lower().rstrip(".")
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(host)
+
+        cached = entry is not None and now < entry.expires_at
+        if not cached:
+            entry = self._fill(host)
+        elif entry.addrs and entry.expires_at - now < (1 - self.refresh_ahead) * entry.ttl:
+            self._refresh_async(host, entry)
+
+        if entry.error:
+            raise DNSError(entry.error)
+        return entry.addrs, cached
+
+class _CachedDNSMixin:
+    dns_cache: DNSCache | None = None
+
+    def _new_conn(self):
+        # only the socket goes to the cached address; `host` (SNI, cert check, Host header) keeps the name
+        if self.dns_cache is None:
+            return super()._new_conn()
+        try:
+            addr = self.dns_cache.resolve(self._dns_host)[0][0]
+        except DNSError:
+            return super()._new_conn()  # let urllib3 try the system resolver and report the error its own way
+        try:
+            sock = connection.create_connection(
+                (addr, self.port), self.timeout,
+                source_address=self.source_address, socket_options=self.socket_options,
+            )
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        except socket.timeout as e:
+            raise ConnectTimeoutError(
+                self, f"Connection to {self.host} timed out. (connect timeout={self.timeout})"
+            ) from e
+        except OSError as e:
+            raise NewConnectionError(self, f"Failed to establish a new connection: {e}") from e
+        return sock
+
+def _pool_classes(cache: DNSCache) -> dict:
+    http_conn = type("CachedHTTPConnection", (_CachedDNSMixin, HTTPConnection), {"dns_cache": cache})
+    https_conn = type("CachedHTTPSConnection", (_CachedDNSMixin, HTTPSConnection), {"dns_cache": cache})
+    return {
+        "http": type("CachedHTTPConnectionPool", (HTTPConnectionPool,), {"ConnectionCls": http_conn}),
+        "https": type("CachedHTTPSConnectionPool", (HTTPSConnectionPool,), {"ConnectionCls": https_conn}),
+    }
+
+class CachingAdapter(HTTPAdapter):
+    """requests adapter whose connections look hosts up in a DNSCache."""
+
+    def __init__(self, cache: DNSCache, **kwargs):
+        if cache._pools is None:
+            cache._pools = _pool_classes(cache)
+        self._pool_classes = cache._pools
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = dict(self._pool_classes)
@@ -0,0 +1,110 @@
+import csv
+import heapq
+import io
+import json
+from itertools import repeat
+from operator import itemgetter
+from sqlalchemy import select
+
+from . import history
+from .db import db, Service, CheckResult, MetricsSnapshot, StateInterval
+
+BATCH_ROWS = 500  # rows per yielded chunk and per cursor fetch
+
+CHECK_COLUMNS = [
+    ("service", Service.slug), ("host", Service.beszel_host),
+    ("checked_at", CheckResult.checked_at), ("ok", CheckResult.ok),
+    ("status_code", CheckResult.status_code), ("latency_ms", CheckResult.latency_ms),
+    ("dns_ms", CheckResult.dns_ms), ("error", CheckResult.error),
+]
+
+INTERVAL_COLUMNS = [
+    ("service", Service.slug), ("host", Service.beszel_host),
+    ("started_at", StateInterval.started_at), ("ended_at", StateInterval.ended_at),
+    ("ok", StateInterval.ok), ("status_code", StateInterval.status_code),
+    ("probe_count", StateInterval.probe_count),
+    ("latency_min_ms", StateInterval.latency_min_ms), ("latency_max_ms", StateInterval.latency_max_ms),
+    ("latency_sum_ms", StateInterval.latency_sum_ms), ("latency_count", StateInterval.latency_count),
+    ("error", StateInterval.error),
+]
+
+METRIC_COLUMNS = [
+    ("service", Service.slug), ("host", Service.beszel_host),
+    ("checked_at", MetricsSnapshot.checked_at),
+    ("host_cpu", MetricsSnapshot.host_cpu), ("host_mem_used_bytes", MetricsSnapshot.host_mem_used_bytes),
+    ("host_mem_total_bytes", MetricsSnapshot.host_mem_total_bytes), ("host_mem_pct", MetricsSnapshot.host_mem_pct),
+    ("ctr_cpu", MetricsSnapshot.ctr_cpu), ("ctr_mem_mb", MetricsSnapshot.ctr_mem_mb),
+    ("ctr_uptime", MetricsSnapshot.ctr_uptime), ("ctr_health", MetricsSnapshot.ctr_health),
+]
+
+def build_query(model, columns, time_col, time_end_col=None, *, services=None, hosts=None, since=None, until=None):
+    """SELECT for an export; time_end_col lets interval rows match on overlap."""
+    stmt = (select(*[c for _, c in columns])
+            .join(Service, Service.id == model.service_id)
+            .order_by(time_col.asc(), model.id.asc()))
+    if services:
+        stmt = stmt.where(Service.slug.in_(services))
+    if hosts:
+        stmt = stmt.where(Service.beszel_host.in_(hosts))
+    if since is not None:
+        stmt = stmt.where((time_end_col if time_end_col is not None else time_col) >= since)
+    if until is not None:
+        stmt = stmt.where(time_col <= until)
+    return stmt
+
+def _query_rows(stmt):
+    # Server-side cursor: rows are fetched BATCH_ROWS at a time, never all at once
+    result = db.session.execute(stmt.execution_options(stream_results=True, yield_per=BATCH_ROWS))
+    try:
+        for part in result.partitions(BATCH_ROWS):
+            yield from part
+    finally:
+        result.close()
+
+def _series_rows(schema, columns, service, since, until):
+    fixed = {"service": service.slug, "host": service.beszel_host}
+    for cols in history.series.iter_scan(schema, service.id, since, until):
+        # zip stops with the real columns; the constant ones just repeat
+        yield from zip(*(repeat(fixed[n]) if n in fixed else cols[n] for n, _ in columns))
+
+def export_rows(stmt, columns, *, schema=None, services=None, hosts=None, since=None, until=None):
+    """Rows for an export: SQLite, merged by time with the segment store when it is enabled."""
+    rows = _query_rows(stmt)
+    if schema is None or history.series is None:
+        return rows
+
+    q = Service.query
+    if services:
+        q = q.filter(Service.slug.in_(services))
+    if hosts:
+        q = q.filter(Service.beszel_host.in_(hosts))
+    streams = [_series_rows(schema, columns, svc, since, until) for svc in q.all()]
+    # column 2 is the timestamp in every *_COLUMNS list
+    return heapq.merge(rows, *streams, key=itemgetter(2))
+
+def _batches(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_ROWS:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def stream_ndjson(rows, columns):
+    names = [n for n, _ in columns]
+    for part in _batches(rows):
+        yield "".join(json.dumps(dict(zip(names, row)), separators=(",", ":")) + "\n" for row in part)
+
+def stream_csv(rows, columns):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow([n for n, _ in columns])
+    for part in _batches(rows):
+        w.writerows(part)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue()
@@ -0,0 +1,93 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable
+
+from .beszel import BeszelClient
+
+class BeszelFederation:
+    """Named Beszel hubs, each with its own client (token cache, timeout).
+
+    Work is fanned out to all hubs at once; a hub that errors or misses the
+    deadline only affects its own services. Each hub has its own worker, and a
+    hub whose last call is still running past the deadline is skipped rather
+    than queued, so a hung hub never holds up the others or piles up work.
+    """
+
+    def __init__(self, clients: dict[str, BeszelClient], *, deadline=8.0):
+        self.clients = clients
+        self.deadline = deadline
+        self._pools = {name: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"beszel-hub-{name}")
+                       for name in clients}
+        self._inflight: dict[str, tuple[Any, float]] = {}  # hub -> (last future, submitted at)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, sources: dict[str, dict[str, str]], *, timeout=3.0, deadline=8.0):
+        clients = {name: BeszelClient(cfg["base_url"], cfg["email"], cfg["password"], timeout=timeout)
+                   for name, cfg in sources.items()}
+        return cls(clients, deadline=deadline)
+
+    @property
+    def names(self) -> list[str]:
+        return list(self.clients)
+
+    def split_host(self, beszel_host: str | None) -> tuple[str | None, str]:
+        """Split "site-a:arborlon" into ("site-a", "arborlon") when site-a is a configured hub."""
+        value = (beszel_host or "").strip()
+        source, sep, host = value.partition(":")
+        if sep and source.strip() in self.clients:
+            return source.strip(), host.strip()
+        return None, value
+
+    def run(self, fn: Callable[[str, BeszelClient], Any], names: list[str] | None = None) -> dict[str, tuple[Any, str | None]]:
+        """Call fn(name, client) for each hub concurrently -> {name: (result, error)}."""
+        names = [n for n in (names if names is not None else self.names) if n in self.clients]
+        out, futures = {}, {}
+        now = time.monotonic()
+        with self._lock:
+            for n in names:
+                prev, submitted = self._inflight.get(n, (None, now))
+                if prev is not None and not prev.done() and now - submitted > self.deadline:
+                    out[n] = (None, f"hub {n}: still busy with a request older than {self.deadline:g}s")
+                    continue
+                fut = self._pools[n].submit(fn, n, self.clients[n])
+                self._inflight[n] = (fut, now)
+                futures[fut] = n
+        done, _ = wait(futures, timeout=self.deadline)
+
+        for fut, name in futures.items():
+            if fut not in done:
+                out[name] = (None, f"hub {name}: no response within {self.deadline:g}s")
+                continue
+            try:
+                out[name] = (fut.result(), None)
+            except Exception as e:
+                out[name] = (None, f"hub {name}: {e}")
+        return out
+
+def fetch_hub_metrics(client: BeszelClient, jobs: list[tuple[str | None, str | None]]) -> dict[str, Any]:
+    """System statuses, latest system_stats per system and container records by id for one hub.
+
+    Runs on a pool thread, so it only does HTTP (no DB / app context).
+    """
+    stats, containers, errors, statuses = {}, {}, {}, {}
+    try:
+        # up / down / paused / pending; feeds host-aware probe suppression
+        statuses = {r.get("id"): r.get("status") for r in client.list_all("systems", fields="id,status")}
+    except Exception as e:
+        errors[("systems", None)] = str(e)
+    for system_id, container_id in jobs:
+        if system_id and system_id not in stats:
+            try:
+                stats[system_id] = client.first_record("system_stats", filter_str=f'system="{system_id}"', sort="-created")
+            except Exception as e:
+                stats[system_id] = None
+                errors[("system_stats", system_id)] = str(e)
+        if container_id and container_id not in containers:
+            try:
+                containers[container_id] = client.get_record("containers", container_id)
+            except Exception as e:
+                containers[container_id] = None
+                errors[("containers", container_id)] = str(e)
+    return {"stats": stats, "containers": containers, "errors": errors, "statuses": statuses}
@@ -1,17 +1,39 @@
 import time
 import requests
 from typing import Any
+from urllib.parse import urlsplit
+
+from .dnscache import CachingAdapter, DNSCache, DNSError
 
 def run_health_check(url: str, *, headers: dict[str, str] | None = None,
                      basic_user: str | None = None, basic_pass: str | None = None,
-                     timeout=2.5) -> dict[str, Any]:
+                     timeout=2.5, dns_cache: DNSCache | None = None) -> dict[str, Any]:
+    # DNS is resolved (or served from cache) up front so it is timed separately
+    # from the request and a resolver failure isn't mistaken for a service failure.
+    dns_ms = None
+    if dns_cache is not None:
+        host = urlsplit(url).hostname
+        if host:
+            t_dns = time.time()
+            try:
+                dns_cache.resolve(host)
+            except DNSError as e:
+                ms = int((time.time() - t_dns) * 1000)
+                return {"ok": False, "status_code": None, "latency_ms": None, "dns_ms": ms, "error": f"dns: {e}"}
+            dns_ms = int((time.time() - t_dns) * 1000)
+
     t0 = time.time()
     try:
         auth = (basic_user, basic_pass) if basic_user and basic_pass else None
-        r = requests.get(url, headers=headers or {}, auth=auth, timeout=timeout, allow_redirects=True)
+        with requests.Session() as sess:
+            if dns_cache is not None:
+                adapter = CachingAdapter(dns_cache)
+                sess.mount("http://", adapter)
+                sess.mount("https://", adapter)
+            r = sess.get(url, headers=headers or {}, auth=auth, timeout=timeout, allow_redirects=True)
         ms = int((time.time() - t0) * 1000)
         ok = 200 <= r.status_code < 400
-        return {"ok": ok, "status_code": r.status_code, "latency_ms": ms, "error": None}
+        return {"ok": ok, "status_code": r.status_code, "latency_ms": ms, "dns_ms": dns_ms, "error": None}
     except Exception as e:
         ms = int((time.time() - t0) * 1000)
-        return {"ok": False, "status_code": None, "latency_ms": ms, "error": str(e)}
+        return {"ok": False, "status_code": None, "latency_ms": ms, "dns_ms": dns_ms, "error": str(e)}
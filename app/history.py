@@ -0,0 +1,206 @@
+from collections import namedtuple
+from typing import Any
+from sqlalchemy import func
+
+from .config import Settings
+from .db import db, CheckResult, MetricsSnapshot, StateInterval
+from .segments import SegmentStore, CHECKS, METRICS
+
+# Segment store for bulk samples when DASH_TS_BACKEND=segments (None = everything in SQLite)
+series = (SegmentStore(Settings.SERIES_DIR, seal_rows=Settings.SERIES_SEAL_ROWS)
+          if Settings.TS_BACKEND == "segments" else None)
+
+_SeriesRow = namedtuple("_SeriesRow", "checked_at ok status_code latency_ms error")
+
+# An open interval is only extended if the previous probe landed within this many
+# poll periods; a longer gap (app down, scheduler stalled) starts a fresh interval
+# so the reconstructed timeline never papers over time we didn't observe.
+MAX_GAP_POLLS = 3
+
+def _same_state(iv: StateInterval, r: dict[str, Any]) -> bool:
+    return (bool(iv.ok) == bool(r["ok"])
+            and iv.status_code == r["status_code"]
+            and (iv.error or None) == (r["error"] or None))
+
+def _add_latency(iv: StateInterval, latency_ms: int | None):
+    if latency_ms is None:
+        return
+    iv.latency_min_ms = latency_ms if iv.latency_min_ms is None else min(iv.latency_min_ms, latency_ms)
+    iv.latency_max_ms = latency_ms if iv.latency_max_ms is None else max(iv.latency_max_ms, latency_ms)
+    iv.latency_sum_ms = (iv.latency_sum_ms or 0) + latency_ms
+    iv.latency_count = (iv.latency_count or 0) + 1
+
+def record_check(service_id: int, checked_at: int, r: dict[str, Any]):
+    """Persist one probe result using the configured backend / history mode (caller commits)."""
+    if series is not None:
+        # every probe is cheap to keep here, so the segment store ignores DASH_HISTORY_MODE
+        series.append(CHECKS, service_id, {**r, "checked_at": checked_at})
+        return
+
+    if Settings.HISTORY_MODE != "intervals":
+        db.session.add(CheckResult(
+            service_id=service_id,
+            checked_at=checked_at,
+            ok=r["ok"],
+            status_code=r["status_code"],
+            latency_ms=r["latency_ms"],
+            dns_ms=r.get("dns_ms"),
+            error=r["error"],
+        ))
+        return
+
+    iv = (StateInterval.query
+          .filter_by(service_id=service_id)
+          .order_by(StateInterval.ended_at.desc())
+          .first())
+
+    max_gap = max(1, Settings.POLL_HEALTH_SECONDS) * MAX_GAP_POLLS
+    if iv and _same_state(iv, r) and 0 <= checked_at - (iv.ended_at or 0) <= max_gap:
+        iv.ended_at = checked_at
+        iv.probe_count = (iv.probe_count or 0) + 1
+        _add_latency(iv, r["latency_ms"])
+        return
+
+    iv = StateInterval(
+        service_id=service_id,
+        ok=r["ok"],
+        status_code=r["status_code"],
+        error=r["error"],
+        started_at=checked_at,
+        ended_at=checked_at,
+        probe_count=1,
+        latency_sum_ms=0,
+        latency_count=0,
+    )
+    _add_latency(iv, r["latency_ms"])
+    db.session.add(iv)
+
+def record_metrics(service_id: int, checked_at: int, m: dict[str, Any]):
+    """Persist one metrics sample (MetricsSnapshot column names; caller commits)."""
+    if series is not None:
+        series.append(METRICS, service_id, {**m, "checked_at": checked_at})
+        return
+    db.session.add(MetricsSnapshot(service_id=service_id, checked_at=checked_at, **m))
+
+def _interval_dict(iv: StateInterval) -> dict[str, Any]:
+    return {
+        "ok": bool(iv.ok),
+        "status_code": iv.status_code,
+        "error": iv.error,
+        "start": iv.started_at,
+        "end": iv.ended_at,
+        "probes": iv.probe_count,
+        "latency_ms": {
+            "min": iv.latency_min_ms,
+            "max": iv.latency_max_ms,
+            "avg": round(iv.latency_sum_ms / iv.latency_count, 1) if iv.latency_count else None,
+        },
+    }
+
+def _collapse_rows(rows) -> list[dict[str, Any]]:
+    # Fold per-probe CheckResult rows into the same interval shape (rows mode)
+    out: list[dict[str, Any]] = []
+    cur: StateInterval | None = None
+    for row in rows:
+        r = {"ok": row.ok, "status_code": row.status_code, "error": row.error, "latency_ms": row.latency_ms}
+        if cur is not None and _same_state(cur, r):
+            cur.ended_at = row.checked_at
+            cur.probe_count += 1
+            _add_latency(cur, row.latency_ms)
+            continue
+        if cur is not None:
+            out.append(_interval_dict(cur))
+        cur = StateInterval(ok=row.ok, status_code=row.status_code, error=row.error,
+                            started_at=row.checked_at, ended_at=row.checked_at, probe_count=1,
+                            latency_sum_ms=0, latency_count=0)
+        _add_latency(cur, row.latency_ms)
+    if cur is not None:
+        out.append(_interval_dict(cur))
+    return out
+
+def timeline(service_id: int, since: int, until: int) -> list[dict[str, Any]]:
+    """State timeline for a service as ordered intervals overlapping [since, until]."""
+    # Read both stores so history survives switching DASH_HISTORY_MODE
+    ivs = (StateInterval.query
+           .filter(StateInterval.service_id == service_id,
+                   StateInterval.ended_at >= since,
+                   StateInterval.started_at <= until)
+           .order_by(StateInterval.started_at.asc())
+           .all())
+    out = [_interval_dict(iv) for iv in ivs]
+
+    rows = (CheckResult.query
+            .filter(CheckResult.service_id == service_id,
+                    CheckResult.checked_at >= since,
+                    CheckResult.checked_at <= until)
+            .order_by(CheckResult.checked_at.asc())
+            .all())
+    out.extend(_collapse_rows(rows))
+    if series is not None:
+        cols = series.scan(CHECKS, service_id, since, until)
+        out.extend(_collapse_rows(_SeriesRow(*vals) for vals in zip(*(cols[n] for n in _SeriesRow._fields))))
+    out.sort(key=lambda iv: iv["start"])
+    return out
+
+def _newest(model, time_col, service_ids: list[int]) -> dict[int, Any]:
+    # one indexed max() per service group, then fetch just those rows
+    latest = (db.session.query(model.service_id, func.max(time_col).label("at"))
+              .filter(model.service_id.in_(service_ids))
+              .group_by(model.service_id)
+              .subquery())
+    rows = (model.query
+            .join(latest, (model.service_id == latest.c.service_id) & (time_col == latest.c.at))
+            .all())
+    return {r.service_id: r for r in rows}
+
+def last_known(services) -> dict[str, Any]:
+    """Newest stored probe result and metrics sample per service, shaped like
+    SnapshotStore.read(); used to warm the snapshot when there is nothing better."""
+    ids = [s.id for s in services]
+    checks = _newest(CheckResult, CheckResult.checked_at, ids)
+    intervals = _newest(StateInterval, StateInterval.ended_at, ids)
+    metrics = _newest(MetricsSnapshot, MetricsSnapshot.checked_at, ids)
+
+    out = {"health_checked_at": 0, "metrics_checked_at": 0, "services": []}
+    for s in services:
+        candidates = []
+        if s.id in checks:
+            r = checks[s.id]
+            candidates.append({"checked_at": r.checked_at, "ok": bool(r.ok), "status_code": r.status_code,
+                               "latency_ms": r.latency_ms, "dns_ms": r.dns_ms, "error": r.error})
+        if s.id in intervals:
+            iv = intervals[s.id]
+            candidates.append({"checked_at": iv.ended_at, "ok": bool(iv.ok), "status_code": iv.status_code,
+                               "latency_ms": None, "dns_ms": None, "error": iv.error})
+        if series is not None:
+            r = series.last(CHECKS, s.id)
+            if r:
+                candidates.append({k: r[k] for k in ("checked_at", "ok", "status_code", "latency_ms", "dns_ms", "error")})
+        health = max(candidates, key=lambda h: h["checked_at"] or 0, default=None)
+
+        m = metrics.get(s.id)
+        m = {n: getattr(m, n) for n in METRICS.names} if m else None
+        if series is not None:
+            r = series.last(METRICS, s.id)
+            if r and (m is None or r["checked_at"] > m["checked_at"]):
+                m = r
+
+        slot = {"id": s.slug, "beszel_host": s.beszel_host, "beszel_container": s.beszel_container,
+                "health": None, "metrics": None}
+        if health:
+            slot["health"] = {"id": s.slug, **health}
+            out["health_checked_at"] = max(out["health_checked_at"], health["checked_at"] or 0)
+        if m:
+            slot["metrics"] = {
+                "checked_at": m["checked_at"],
+                "system": {"cpu": m["host_cpu"], "mem_used": m["host_mem_used_bytes"],
+                           "mem_total": m["host_mem_total_bytes"], "mem_percent": m["host_mem_pct"]},
+                "container": {
+                    "state": None if m["ctr_health"] is None else ("Healthy" if m["ctr_health"] == 0 else "Unhealthy"),
+                    "uptime": m["ctr_uptime"], "cpu": m["ctr_cpu"],
+                    "mem_used": float(m["ctr_mem_mb"]) * 1024 * 1024 if m["ctr_mem_mb"] is not None else None,
+                },
+            }
+            out["metrics_checked_at"] = max(out["metrics_checked_at"], m["checked_at"] or 0)
+        out["services"].append(slot)
+    return out
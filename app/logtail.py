@@ -0,0 +1,297 @@
+import json
+import threading
+import time
+from collections import deque
+import requests
+from urllib3.exceptions import HTTPError as UrllibHTTPError
+
+def _sse_lines(r):
+    """Lines as soon as they arrive. iter_lines() waits for a full 512-byte
+    chunk, which holds a slow container's lines back for seconds."""
+    buf = b""
+    while True:
+        chunk = r.raw.read1(8192)
+        if not chunk:
+            if buf:
+                yield buf.decode("utf-8", "replace")
+            return
+        *lines, buf = (buf + chunk).split(b"\n")
+        for line in lines:
+            yield line.rstrip(b"\r").decode("utf-8", "replace")
+
+class DozzleDirectory:
+    """Container name (or id) -> (Dozzle host id, container id).
+
+    Dozzle's stream endpoint wants ids, not names; its own UI learns them from
+    the `containers-changed` event on /api/events/stream, and so do we. The
+    list is cached for `ttl` seconds and re-fetched early on a miss.
+    """
+
+    def __init__(self, base_url: str, *, ttl=60, timeout=5.0):
+        self.base_url = base_url
+        self.ttl = ttl
+        self.timeout = timeout
+        self._by_key: dict[str, tuple[str, str]] = {}
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fetch(self) -> dict[str, tuple[str, str]]:
+        out = {}
+        with requests.get(self.base_url + "/api/events/stream", stream=True, timeout=self.timeout,
+                          headers={"Accept": "text/event-stream"}) as r:
+            r.raise_for_status()
+            event = None
+            deadline = time.time() + self.timeout
+            for raw in _sse_lines(r):
+                if raw.startswith("event:"):
+                    event = raw[6:].strip()
+                elif raw.startswith("data:") and event == "containers-changed":
+                    for c in json.loads(raw[5:]):
+                        ref = (c.get("host") or "", c.get("id") or "")
+                        if c.get("name"):
+                            out.setdefault(c["name"].lstrip("/"), ref)
+                        if c.get("id"):
+                            out[c["id"]] = ref
+                    return out
+                elif not raw:
+                    event = None
+                if time.time() > deadline:
+                    break
+        return out
+
+    def lookup(self, name: str) -> tuple[str, str] | None:
+        with self._lock:
+            age = time.time() - self._fetched_at
+            hit = self._by_key.get(name)
+            if hit and age < self.ttl:
+                return hit
+            if not hit and age < min(5, self.ttl):
+                return None  # just looked; don't hammer Dozzle for an unknown name
+            try:
+                self._by_key = self._fetch()
+            except Exception:
+                pass  # keep serving the last list
+            self._fetched_at = time.time()
+            return self._by_key.get(name)
+
+class LogTail:
+    """One upstream Dozzle stream per container, fanned out to any number of viewers.
+
+    Lines land in a bounded ring buffer tagged with a monotonically increasing
+    sequence number. The upstream reader never waits on viewers: a viewer that
+    falls behind the ring just skips ahead and is told how many lines it missed.
+    """
+
+    def __init__(self, key: str, url: str, *, max_lines=500, max_line_bytes=4096, timeout=5.0, read_timeout=10.0):
+        self.key = key
+        self.url = url
+        self.max_line_bytes = max_line_bytes
+        self.timeout = timeout
+        self.read_timeout = read_timeout
+
+        self._buf = deque(maxlen=max_lines)  # (seq, line)
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._viewers = 0
+        self._idle_since = time.time()
+        self._closed = False
+        self._resp = None
+        self._last_event_id = None
+        self.error = None
+
+        self._thread = threading.Thread(target=self._run, name=f"logtail-{key}", daemon=True)
+        self._thread.start()
+
+    def _clip(self, line: str) -> str:
+        b = line.encode("utf-8", "replace")
+        if len(b) <= self.max_line_bytes:
+            return line
+        return b[:self.max_line_bytes].decode("utf-8", "ignore") + " …[truncated]"
+
+    @staticmethod
+    def _parse(raw: str) -> str | None:
+        # Dozzle streams SSE; each log event is a JSON object whose "m" is the message
+        if not raw or raw.startswith(":"):
+            return None
+        if raw.startswith("data:"):
+            raw = raw[5:].strip()
+        elif raw.startswith(("event:", "id:", "retry:")):
+            return None
+        try:
+            obj = json.loads(raw)
+        except Exception:
+            return raw
+        if isinstance(obj, dict):
+            m = obj.get("m")
+            if m is None:
+                return None
+            return m if isinstance(m, str) else json.dumps(m)
+        return raw
+
+    def _push(self, line: str):
+        with self._cond:
+            self._seq += 1
+            self._buf.append((self._seq, self._clip(line)))
+            self._cond.notify_all()
+
+    def _connect(self):
+        headers = {"Accept": "text/event-stream"}
+        if self._last_event_id:
+            headers["Last-Event-ID"] = self._last_event_id  # resume, don't replay
+        r = requests.get(self.url, stream=True, timeout=(self.timeout, self.read_timeout), headers=headers)
+        r.raise_for_status()
+        return r
+
+    def _run(self):
+        # A finite read timeout is what lets close() take effect on a quiet
+        # container: closing the response from another thread does not wake a
+        # blocked recv. A timeout while viewers are still attached reconnects.
+        try:
+            while not self._closed:
+                with self._connect() as r:
+                    self._resp = r
+                    try:
+                        for raw in _sse_lines(r):
+                            if self._closed:
+                                break
+                            if raw and raw.startswith("id:"):
+                                self._last_event_id = raw[3:].strip()
+                                continue
+                            line = self._parse(raw)
+                            if line is not None:
+                                self._push(line)
+                        else:
+                            return  # upstream ended (container stopped)
+                    except (requests.ConnectionError, UrllibHTTPError):
+                        if self._closed or not self.viewers:
+                            return
+        except Exception as e:
+            if not self._closed:
+                self.error = str(e)
+        finally:
+            with self._cond:
+                self._closed = True
+                self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    @property
+    def viewers(self) -> int:
+        with self._cond:
+            return self._viewers
+
+    def acquire(self):
+        with self._cond:
+            self._viewers += 1
+
+    def release(self):
+        with self._cond:
+            self._viewers -= 1
+            if self._viewers <= 0:
+                self._viewers = 0
+                self._idle_since = time.time()
+
+    def idle_for(self) -> float:
+        with self._cond:
+            return 0.0 if self._viewers else time.time() - self._idle_since
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        resp = self._resp
+        if resp is not None:
+            try:
+                resp.close()
+            except Exception:
+                pass
+
+    def read(self, after: int, *, wait: float):
+        """Return (lines, dropped, cursor) for everything after sequence `after`.
+
+        Blocks up to `wait` seconds when there is nothing new yet.
+        """
+        with self._cond:
+            if self._seq <= after and not self._closed:
+                self._cond.wait(timeout=wait)
+            if not self._buf or self._seq <= after:
+                return [], 0, max(after, self._seq)
+            oldest = self._buf[0][0]
+            dropped = max(0, oldest - after - 1)
+            lines = [line for seq, line in self._buf if seq > after]
+            return lines, dropped, self._seq
+
+
+class LogTailHub:
+    def __init__(self, *, max_lines=500, max_line_bytes=4096, idle_timeout=30, timeout=5.0):
+        self.max_lines = max_lines
+        self.max_line_bytes = max_line_bytes
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._tails: dict[str, LogTail] = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def _start_reaper(self):
+        if self._reaper and self._reaper.is_alive():
+            return
+        self._reaper = threading.Thread(target=self._reap_loop, name="logtail-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(max(1, self.idle_timeout // 3))
+            with self._lock:
+                for key, tail in list(self._tails.items()):
+                    if tail.closed or tail.idle_for() >= self.idle_timeout:
+                        tail.close()
+                        del self._tails[key]
+                if not self._tails:
+                    self._reaper = None
+                    return
+
+    def attach(self, key: str, url: str) -> LogTail:
+        """Get (or start) the shared tail for `key` and register a viewer on it."""
+        with self._lock:
+            tail = self._tails.get(key)
+            if tail is None or tail.closed:
+                tail = LogTail(key, url, max_lines=self.max_lines, max_line_bytes=self.max_line_bytes,
+                               timeout=self.timeout, read_timeout=max(1, self.idle_timeout / 3))
+                self._tails[key] = tail
+            tail.acquire()
+            self._start_reaper()
+            return tail
+
+    def stream(self, key: str, url: str, *, backlog=100, heartbeat=15.0, max_lines=None):
+        """SSE generator for one viewer. Releases its slot when the client goes away."""
+        tail = self.attach(key, url)
+        sent = 0
+        try:
+            lines, _, cursor = tail.read(-1, wait=0)
+            for line in lines[-backlog:] if backlog else []:
+                if max_lines and sent >= max_lines:
+                    break
+                yield f"data: {json.dumps(line)}\n\n"
+                sent += 1
+
+            while True:
+                if max_lines and sent >= max_lines:
+                    yield "event: capped\ndata: {}\n\n"
+                    return
+                lines, dropped, cursor = tail.read(cursor, wait=heartbeat)
+                if dropped:
+                    yield f"event: dropped\ndata: {dropped}\n\n"
+                for line in lines:
+                    if max_lines and sent >= max_lines:
+                        break
+                    yield f"data: {json.dumps(line)}\n\n"
+                    sent += 1
+                if not lines and not dropped:
+                    if tail.closed:
+                        yield f"event: closed\ndata: {json.dumps(tail.error or '')}\n\n"
+                        return
+                    yield ": keepalive\n\n"
+        finally:
+            tail.release()
@@ -0,0 +1,273 @@
+import json
+import marshal
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from flask import g, request
+
+CONTROL_FILE = "profiling.json"
+MAX_DEPTH = 128
+PROFILE_NAME = re.compile(r"^(\d+)-\d+-\d+\.json$")  # <start ms>-<pid>-<seq>.json
+
+def _frame_key(code) -> tuple[str, int, str]:
+    return (code.co_filename, code.co_firstlineno, code.co_name)
+
+def _stack(frame) -> tuple:
+    out = []
+    while frame is not None and len(out) < MAX_DEPTH:
+        out.append(_frame_key(frame.f_code))
+        frame = frame.f_back
+    out.reverse()  # root first
+    return tuple(out)
+
+def _short(filename: str) -> str:
+    parts = Path(filename).parts
+    return "/".join(parts[-2:]) if len(parts) > 1 else filename
+
+class _Active:
+    __slots__ = ("kind", "name", "thread_id", "started_at", "t0", "samples")
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+        self.thread_id = threading.get_ident()
+        self.started_at = time.time()
+        self.t0 = time.perf_counter()
+        self.samples: Counter = Counter()  # stack -> seconds of wall time
+
+class Profiler:
+    """Sampling profiler for requests and scheduler jobs, switched on at runtime.
+
+    While enabled, `sample_rate` of requests/job runs are profiled by a single
+    sampler thread that reads the running thread's stack every `interval`
+    seconds (wall time, so time blocked on Beszel or SQLite shows up). Profiles
+    are written to `directory`, newest `max_profiles` kept, so every worker sees
+    the same set; the on/off switch lives there too. Disabled, the only cost is
+    one attribute check per request.
+    """
+
+    def __init__(self, app=None, *, directory: str, max_profiles=50, interval=0.005,
+                 sample_rate=0.1, skip_endpoints=()):
+        self.directory = Path(directory)
+        self.max_profiles = max_profiles
+        self.interval = interval
+        self.default_sample_rate = sample_rate
+        self.skip_endpoints = set(skip_endpoints)
+        self.enabled = False
+        self.sample_rate = sample_rate
+        self.until = None
+        self._control_mtime = None
+        self._active: dict[int, _Active] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sampler = None
+        self._seq = 0
+        self.reload()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    # ---- runtime switch (shared by all workers through the control file) ----
+
+    def state(self) -> dict:
+        return {"enabled": self.enabled, "sample_rate": self.sample_rate, "until": self.until}
+
+    def configure(self, *, enabled: bool, sample_rate: float | None = None, duration: int | None = None):
+        rate = self.default_sample_rate if sample_rate is None else min(1.0, max(0.0, float(sample_rate)))
+        until = int(time.time()) + duration if enabled and duration else None
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = self.directory / f".{CONTROL_FILE}.{os.getpid()}"
+        tmp.write_text(json.dumps({"enabled": bool(enabled), "sample_rate": rate, "until": until}))
+        os.replace(tmp, self.directory / CONTROL_FILE)
+        self.reload()
+
+    def reload(self):
+        """Pick up the control file if it changed; cheap enough to run every few seconds."""
+        path = self.directory / CONTROL_FILE
+        try:
+            mtime = path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if mtime != self._control_mtime:
+            self._control_mtime = mtime
+            try:
+                doc = json.loads(path.read_text()) if mtime else {}
+            except (OSError, ValueError):
+                doc = {}
+            self.sample_rate = float(doc.get("sample_rate", self.default_sample_rate))
+            self.until = doc.get("until")
+            self.enabled = bool(doc.get("enabled"))
+        if self.enabled and self.until and time.time() > self.until:
+            self.enabled = False
+
+    # ---- capture ----
+
+    def _start(self, kind: str, name: str) -> _Active | None:
+        if random.random() >= self.sample_rate:
+            return None
+        prof = _Active(kind, name)
+        with self._lock:
+            if prof.thread_id in self._active:
+                return None  # nested (e.g. a job calling into a profiled helper); outer one wins
+            self._active[prof.thread_id] = prof
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._sample_loop, name="profiler", daemon=True)
+                self._sampler.start()
+        self._wake.set()
+        return prof
+
+    def _stop(self, prof: _Active, **meta):
+        duration = time.perf_counter() - prof.t0
+        with self._lock:
+            self._active.pop(prof.thread_id, None)
+        if prof.samples:
+            self._save(prof, duration, meta)
+
+    def _sample_loop(self):
+        last = time.perf_counter()
+        while True:
+            with self._lock:
+                idle = not self._active
+                if idle:
+                    self._wake.clear()
+            if idle:
+                self._wake.wait()
+                last = time.perf_counter()
+                continue
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            frames = sys._current_frames()
+            with self._lock:
+                for tid, prof in self._active.items():
+                    frame = frames.get(tid)
+                    if frame is not None:
+                        # weight by the real gap (the GIL can delay us), not the nominal interval
+                        prof.samples[_stack(frame)] += now - max(last, prof.t0)
+            last = now
+            del frames
+
+    def call(self, name: str, fn, *args, **kwargs):
+        """Run a scheduler job body, profiling it if this run is sampled."""
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        prof = self._start("job", name)
+        if prof is None:
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._stop(prof)
+
+    def _before_request(self):
+        if not self.enabled or request.endpoint in self.skip_endpoints:
+            return
+        g._profile = self._start("request", f"{request.method} {request.path}")
+
+    def _teardown_request(self, exc=None):
+        prof = g.pop("_profile", None)
+        if prof is not None:
+            self._stop(prof, error=type(exc).__name__ if exc else None)
+
+    # ---- bounded store ----
+
+    def _save(self, prof: _Active, duration: float, meta: dict):
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        profile_id = f"{int(prof.started_at * 1000)}-{os.getpid()}-{seq}"
+        doc = {
+            "id": profile_id, "kind": prof.kind, "name": prof.name, "pid": os.getpid(),
+            "started_at": prof.started_at, "duration_ms": round(duration * 1000, 1),
+            "sampled_ms": round(sum(prof.samples.values()) * 1000, 1), **meta,
+            "stacks": [[list(map(list, stack)), round(secs, 6)] for stack, secs in prof.samples.items()],
+        }
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = self.directory / f".{profile_id}.json.tmp"
+            tmp.write_text(json.dumps(doc, separators=(",", ":")))
+            os.replace(tmp, self.directory / f"{profile_id}.json")
+            self._prune()
+        except OSError:
+            pass  # profiling must never break the request it measured
+
+    def _files(self) -> list[Path]:
+        try:
+            # strict match: skips the control file, in-flight ".<id>.json" temp files and strays
+            files = [(int(m.group(1)), p) for p in self.directory.iterdir() if (m := PROFILE_NAME.match(p.name))]
+        except OSError:
+            return []
+        # ids start with the start time in ms, so that is age order
+        return [p for _, p in sorted(files, key=lambda f: (f[0], f[1].name))]
+
+    def _prune(self):
+        files = self._files()
+        for p in files[:max(0, len(files) - self.max_profiles)]:
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+
+    def profiles(self) -> list[dict]:
+        out = []
+        for p in reversed(self._files()):
+            doc = self.load(p.stem)
+            if doc:
+                doc.pop("stacks", None)
+                out.append(doc)
+        return out
+
+    def load(self, profile_id: str) -> dict | None:
+        if not PROFILE_NAME.match(f"{profile_id}.json"):
+            return None
+        try:
+            return json.loads((self.directory / f"{profile_id}.json").read_text())
+        except (OSError, ValueError):
+            return None
+
+def collapsed(doc: dict) -> str:
+    """Brendan Gregg's folded format (flamegraph.pl, speedscope); weights are microseconds."""
+    lines = []
+    for stack, secs in doc["stacks"]:
+        frames = ";".join(f"{fn} ({_short(fname)}:{line})" for fname, line, fn in stack)
+        lines.append(f"{frames} {max(1, int(secs * 1_000_000))}")
+    return "\n".join(sorted(lines)) + "\n"
+
+def pstats_dump(doc: dict) -> bytes:
+    """Samples converted to the marshal format `pstats.Stats` / snakeviz load.
+
+    Call counts are sample counts (a sampler can't count calls); tottime and
+    cumtime are wall seconds attributed from the samples.
+    """
+    stats = {}
+
+    def entry(key):
+        if key not in stats:
+            stats[key] = [0, 0, 0.0, 0.0, {}]
+        return stats[key]
+
+    for stack, secs in doc["stacks"]:
+        stack = [tuple(f) for f in stack]
+        entry(stack[-1])[2] += secs
+        seen, edges = set(), set()
+        for i, key in enumerate(stack):
+            e = entry(key)
+            if key not in seen:  # recursion: count each function once per sample
+                seen.add(key)
+                e[0] += 1
+                e[1] += 1
+                e[3] += secs
+            if i and (stack[i - 1], key) not in edges:
+                edges.add((stack[i - 1], key))
+                nc, cc, tt, ct = e[4].get(stack[i - 1], (0, 0, 0.0, 0.0))
+                leaf = secs if i == len(stack) - 1 else 0.0
+                e[4][stack[i - 1]] = (nc + 1, cc + 1, tt + leaf, ct + secs)
+
+    return marshal.dumps({k: (cc, nc, tt, ct, callers) for k, (cc, nc, tt, ct, callers) in stats.items()})
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Any
+
+from .beszel import BeszelClient, normalize_name
+from .db import db, AppSetting, BeszelResolution, Service
+from .federation import BeszelFederation
+
+SERVICES_FP_KEY = "beszel_index.services_fp"
+BESZEL_FP_KEY = "beszel_index.beszel_fp"
+
+def _fingerprint(obj) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def _services_fingerprint(services: list[Service]) -> str:
+    return _fingerprint(sorted((s.id, s.beszel_host or "", s.beszel_container or "") for s in services))
+
+def _get_setting(key: str) -> str | None:
+    row = AppSetting.query.get(key)
+    return row.value if row else None
+
+def _set_setting(key: str, value: str):
+    row = AppSetting.query.get(key)
+    if row:
+        row.value = value
+    else:
+        db.session.add(AppSetting(key=key, value=value))
+
+def _list_inventory(name: str, client: BeszelClient) -> dict[str, Any]:
+    systems = client.list_all("systems", fields="id,name")
+    containers = client.list_all("containers", fields="id,name,system")
+    return {
+        "systems_by_norm": {normalize_name(s.get("name", "")): s for s in systems if s.get("name")},
+        "containers_by_key": {(c.get("system"), c.get("name")): c for c in containers},
+        "fp": _fingerprint({
+            "s": sorted((s.get("id"), s.get("name")) for s in systems),
+            "c": sorted((c.get("id"), c.get("name"), c.get("system")) for c in containers),
+        }),
+    }
+
+class BeszelIndex:
+    """Persistent Service -> (hub, system id, container record id) map.
+
+    Resolved ids live in `beszel_resolutions` so every worker and restart reuses
+    them. Each hub's inventory (system/container ids and names only) is re-listed
+    at most every `ttl` seconds, all hubs at once; the map is rebuilt only when an
+    inventory or the services' Beszel fields actually change. A hub that can't be
+    listed keeps its services' previous mappings.
+    """
+
+    def __init__(self, hubs: BeszelFederation, *, ttl=300):
+        self.hubs = hubs
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._map: dict[int, dict[str, Any]] | None = None
+        self._inventories: dict[str, dict[str, Any]] = {}
+        self._services_fp = None
+        self._beszel_fp = None
+        self._checked_at = 0.0
+        self.hub_errors: dict[str, str] = {}
+
+    def invalidate(self):
+        """Force an inventory check on the next resolve (e.g. a record id went away)."""
+        self._checked_at = 0.0
+
+    def _load(self):
+        self._map = {
+            r.service_id: {"source": r.source, "system_id": r.system_id, "container_id": r.container_id,
+                           "error": r.error, "resolved_at": r.resolved_at}
+            for r in BeszelResolution.query.all()
+        }
+        self._services_fp = _get_setting(SERVICES_FP_KEY)
+        self._beszel_fp = _get_setting(BESZEL_FP_KEY)
+
+    def _refresh_inventories(self):
+        for name, (inv, err) in self.hubs.run(_list_inventory).items():
+            if err:
+                self.hub_errors[name] = f"beszel inventory {err}"
+            else:
+                self.hub_errors.pop(name, None)
+                self._inventories[name] = inv
+        return _fingerprint({n: (self._inventories[n]["fp"] if n in self._inventories else None)
+                             for n in self.hubs.names})
+
+    def _resolve_one(self, s: Service) -> dict[str, Any]:
+        if not s.beszel_host:
+            return {"source": None, "system_id": None, "container_id": None, "error": "no beszel_host configured"}
+
+        source, host = self.hubs.split_host(s.beszel_host)
+        candidates = [source] if source else self.hubs.names
+        missing = [n for n in candidates if n not in self._inventories]
+        for name in candidates:
+            inv = self._inventories.get(name)
+            if inv is None:
+                continue
+            sys_rec = inv["systems_by_norm"].get(normalize_name(host))
+            if not sys_rec:
+                continue
+            system_id = sys_rec.get("id")
+            res = {"source": name, "system_id": system_id, "container_id": None, "error": None}
+            if s.beszel_container:
+                c = inv["containers_by_key"].get((system_id, s.beszel_container))
+                if c:
+                    res["container_id"] = c.get("id")
+                else:
+                    res["error"] = f'no container "{s.beszel_container}" on "{sys_rec.get("name")}" ({name})'
+            return res
+
+        prev = (self._map or {}).get(s.id)
+        if missing and prev and prev.get("source") and prev.get("system_id"):
+            return dict(prev)  # the hub it lived on is unreachable; keep the last good ids
+        if missing:
+            return {"source": None, "system_id": None, "container_id": None,
+                    "error": f'hub {", ".join(missing)} unavailable; "{host}" not found elsewhere'}
+        where = source or ", ".join(candidates) or "no hubs configured"
+        return {"source": None, "system_id": None, "container_id": None,
+                "error": f'no Beszel system named "{host}" ({where})'}
+
+    def _rebuild(self, services: list[Service], now: int):
+        BeszelResolution.query.delete()
+        out = {}
+        for s in services:
+            res = self._resolve_one(s)
+            res["resolved_at"] = now
+            db.session.add(BeszelResolution(service_id=s.id, source=res["source"], system_id=res["system_id"],
+                                            container_id=res["container_id"], error=res["error"],
+                                            resolved_at=now))
+            out[s.id] = res
+        return out
+
+    def resolve(self, services: list[Service]) -> dict[int, dict[str, Any]]:
+        with self._lock:
+            if self._map is None:
+                self._load()
+
+            services_fp = _services_fingerprint(services)
+            now = time.time()
+            if services_fp == self._services_fp and (now - self._checked_at) < self.ttl:
+                return self._map
+
+            beszel_fp = self._refresh_inventories()
+            self._checked_at = now
+            if not self._inventories:
+                return self._map  # no hub answered; keep serving the last good map
+            if services_fp == self._services_fp and beszel_fp == self._beszel_fp:
+                return self._map
+
+            self._map = self._rebuild(services, int(now))
+            self._services_fp = services_fp
+            self._beszel_fp = beszel_fp
+            _set_setting(SERVICES_FP_KEY, services_fp)
+            _set_setting(BESZEL_FP_KEY, beszel_fp)
+            db.session.commit()
+            return self._map
+
+    def diagnostics(self, services: list[Service]) -> dict[str, Any]:
+        mapping = self.resolve(services)
+        by_id = {s.id: s for s in services}
+        unresolved = []
+        for sid, r in mapping.items():
+            s = by_id.get(sid)
+            if s and r.get("error"):
+                unresolved.append({"id": s.slug, "beszel_host": s.beszel_host,
+                                   "beszel_container": s.beszel_container, "error": r["error"]})
+        return {
+            "checked_at": int(self._checked_at),
+            "hubs": {n: {"ok": n not in self.hub_errors, "error": self.hub_errors.get(n)} for n in self.hubs.names},
+            "resolved": sum(1 for sid, r in mapping.items() if sid in by_id and not r.get("error")),
+            "unresolved": unresolved,
+        }
@@ -0,0 +1,443 @@
+import fcntl
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from contextlib import contextmanager
+from operator import itemgetter
+from pathlib import Path
+from typing import Any, Iterator
+
+SEG_MAGIC = b"WFG1"
+# magic, rows, first_ts, last_ts, ncols; then one u32 byte length per column
+SEG_HEADER = struct.Struct("<4sIIIH")
+NONE_INT = -2**31
+HEAD = "head.bin"
+STRINGS = "strings.jsonl"
+
+# kind -> (head struct code, array typecode when decoded)
+KINDS = {"ts": ("I", "L"), "int": ("i", "l"), "bool": ("i", "l"), "str": ("i", "l"),
+         "f32": ("f", "f"), "f64": ("d", "d")}
+
+class Schema:
+    def __init__(self, name: str, fields: list[tuple[str, str]]):
+        assert fields[0][1] == "ts"
+        self.name = name
+        self.fields = fields
+        self.names = [n for n, _ in fields]
+        self.record = struct.Struct("<" + "".join(KINDS[k][0] for _, k in fields))
+
+CHECKS = Schema("checks", [
+    ("checked_at", "ts"), ("ok", "bool"), ("status_code", "int"),
+    ("latency_ms", "int"), ("dns_ms", "int"), ("error", "str"),
+])
+
+METRICS = Schema("metrics", [
+    ("checked_at", "ts"),
+    ("host_cpu", "f32"), ("host_mem_used_bytes", "f64"), ("host_mem_total_bytes", "f64"), ("host_mem_pct", "f32"),
+    ("ctr_cpu", "f32"), ("ctr_mem_mb", "f32"), ("ctr_uptime", "str"), ("ctr_health", "int"),
+])
+
+# ---- varint column codec: ints are stored as zigzag varints of the delta to the previous value ----
+
+def _zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+def _unzigzag(n: int) -> int:
+    return (n >> 1) ^ -(n & 1)
+
+def _encode_ints(values) -> bytes:
+    out = bytearray()
+    prev = 0
+    for v in values:
+        n = _zigzag(v - prev)
+        prev = v
+        while n >= 0x80:
+            out.append((n & 0x7F) | 0x80)
+            n >>= 7
+        out.append(n)
+    return bytes(out)
+
+def _decode_ints(buf, count: int, typecode: str) -> array:
+    out = array(typecode, bytes(array(typecode).itemsize * count))
+    prev = pos = 0
+    for i in range(count):
+        n = shift = 0
+        while True:
+            b = buf[pos]
+            pos += 1
+            n |= (b & 0x7F) << shift
+            if b < 0x80:
+                break
+            shift += 7
+        prev += _unzigzag(n)
+        out[i] = prev
+    return out
+
+def _to_storage(kind: str, v, strings: "_Strings | None" = None):
+    if kind in ("f32", "f64"):
+        try:
+            return float(v) if v is not None else math.nan
+        except (TypeError, ValueError):
+            return math.nan
+    if kind == "str":
+        return strings.id_for(v) if v else -1
+    if kind == "ts":
+        return int(v)
+    return NONE_INT if v is None else int(v)
+
+def _from_storage(kind: str, v, strings: list[str]):
+    if kind in ("f32", "f64"):
+        return None if math.isnan(v) else v
+    if kind == "str":
+        return strings[v] if 0 <= v < len(strings) else None
+    if kind == "bool":
+        return None if v == NONE_INT else bool(v)
+    if kind == "int":
+        return None if v == NONE_INT else v
+    return v
+
+class _Strings:
+    """Per-series string table (errors, uptimes repeat a lot); rows store the index."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.values: list[str] = []
+        self.ids: dict[str, int] = {}
+        self.size = 0
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        with self._lock:
+            self._refresh()
+
+    def _refresh(self):
+        try:
+            size = self.path.stat().st_size
+        except FileNotFoundError:
+            size = 0
+        if size == self.size:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self.size)
+            for line in f.read(size - self.size).splitlines():
+                value = json.loads(line)
+                self.ids.setdefault(value, len(self.values))
+                self.values.append(value)
+        self.size = size
+
+    def id_for(self, s: str) -> int:
+        # caller holds the series flock, so no other process grows the table meanwhile
+        with self._lock:
+            self._refresh()
+            sid = self.ids.get(s)
+            if sid is None:
+                line = (json.dumps(s) + "\n").encode("utf-8")
+                with open(self.path, "ab") as f:
+                    f.write(line)
+                sid = len(self.values)
+                self.values.append(s)
+                self.ids[s] = sid
+                self.size += len(line)
+            return sid
+
+class _Segment:
+    """Decoded, immutable columnar segment (cached by path)."""
+
+    def __init__(self, schema: Schema, buf):
+        magic, rows, self.first_ts, self.last_ts, ncols = SEG_HEADER.unpack_from(buf, 0)
+        if magic != SEG_MAGIC or ncols != len(schema.fields):
+            raise ValueError("not a segment for this schema")
+        lengths = struct.unpack_from(f"<{ncols}I", buf, SEG_HEADER.size)
+        pos = SEG_HEADER.size + 4 * ncols
+        self.rows = rows
+        self.columns = []
+        for (_, kind), length in zip(schema.fields, lengths):
+            blob = buf[pos:pos + length]
+            pos += length
+            typecode = KINDS[kind][1]
+            if kind in ("f32", "f64"):
+                col = array(typecode)
+                col.frombytes(blob)
+            else:
+                col = _decode_ints(blob, rows, typecode)
+            self.columns.append(col)
+
+def _encode_segment(schema: Schema, columns: list) -> bytes:
+    rows = len(columns[0])
+    blobs = []
+    for (_, kind), col in zip(schema.fields, columns):
+        if kind in ("f32", "f64"):
+            blobs.append(array(KINDS[kind][1], col).tobytes())
+        else:
+            blobs.append(_encode_ints(col))
+    header = SEG_HEADER.pack(SEG_MAGIC, rows, columns[0][0], columns[0][-1], len(blobs))
+    return header + struct.pack(f"<{len(blobs)}I", *map(len, blobs)) + b"".join(blobs)
+
+def _read_mapped(path: Path) -> memoryview | bytes:
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if not size:
+            return b""
+        return memoryview(mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ))
+
+def _segment_rows(path: Path) -> int:
+    """Row count from the header alone."""
+    with open(path, "rb") as f:
+        magic, rows, *_ = SEG_HEADER.unpack(f.read(SEG_HEADER.size))
+    if magic != SEG_MAGIC:
+        raise ValueError(f"{path.name}: not a segment")
+    return rows
+
+def _segment_range(name: str) -> tuple[int, int]:
+    _, first, last = name[:-4].split("-")
+    return int(first), int(last)
+
+class SegmentStore:
+    """Append-only per-service time series on disk, outside SQLite.
+
+    New samples are appended to a fixed-width `head.bin` per service (one
+    struct per row, read back through mmap). The background `compact()` seals
+    full heads into immutable columnar segments (ints delta + zigzag varint,
+    floats raw) and merges small segments into bigger ones. Segment names carry
+    their time range so a range read skips whole files without opening them;
+    decoded segments are cached and sliced by bisecting the timestamp column.
+
+    Writers and the compactor serialize per series with flock, so any worker
+    may append. Readers take no lock: files are only ever replaced by rename.
+    """
+
+    def __init__(self, root: str, *, seal_rows=1024, max_segment_rows=65536, merge_fanin=4, cache_segments=64):
+        self.root = Path(root)
+        self.seal_rows = seal_rows
+        self.max_segment_rows = max_segment_rows
+        self.merge_fanin = merge_fanin
+        self.cache_segments = cache_segments
+        self._strings: dict[Path, _Strings] = {}
+        self._cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _dir(self, schema: Schema, service_id: int) -> Path:
+        return self.root / schema.name / str(int(service_id))
+
+    def _table(self, d: Path) -> _Strings:
+        with self._lock:
+            t = self._strings.get(d)
+            if t is None:
+                t = self._strings[d] = _Strings(d / STRINGS)
+            return t
+
+    @contextmanager
+    def _locked(self, d: Path):
+        d.mkdir(parents=True, exist_ok=True)
+        fd = os.open(d / ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+    # ---- write ----
+
+    def append(self, schema: Schema, service_id: int, row: dict[str, Any]):
+        d = self._dir(schema, service_id)
+        with self._locked(d):
+            table = self._table(d)
+            rec = schema.record.pack(*(_to_storage(k, row.get(n), table) for n, k in schema.fields))
+            fd = os.open(d / HEAD, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, rec)
+            finally:
+                os.close(fd)
+
+    # ---- read ----
+
+    def service_ids(self, schema: Schema) -> list[int]:
+        try:
+            return sorted(int(p.name) for p in (self.root / schema.name).iterdir() if p.name.isdigit())
+        except FileNotFoundError:
+            return []
+
+    def _segment(self, schema: Schema, path: Path) -> _Segment:
+        key = (path, path.stat().st_ino)
+        with self._lock:
+            seg = self._cache.get(key)
+            if seg is not None:
+                self._cache.move_to_end(key)
+                return seg
+        seg = _Segment(schema, _read_mapped(path))
+        with self._lock:
+            self._cache[key] = seg
+            while len(self._cache) > self.cache_segments:
+                self._cache.popitem(last=False)
+        return seg
+
+    def _segment_names(self, d: Path) -> list[str]:
+        names = sorted((n for n in os.listdir(d) if n.startswith("seg-") and n.endswith(".wfg")), key=_segment_range)
+        # mid-merge, the merged file and its inputs can both be listed; keep the widest
+        ranges = [_segment_range(n) for n in names]
+        return [n for n, (a, b) in zip(names, ranges)
+                if not any((c, e) != (a, b) and c <= a and b <= e for c, e in ranges)]
+
+    def scan(self, schema: Schema, service_id: int, since: int | None = None, until: int | None = None) -> dict[str, list]:
+        """Columns for rows with since <= ts <= until, oldest first."""
+        d = self._dir(schema, service_id)
+        for _ in range(3):
+            try:
+                return self._scan(schema, d, since, until)
+            except FileNotFoundError:
+                continue  # compaction replaced a file under us; list again
+        return self._scan(schema, d, since, until)
+
+    def _scan(self, schema: Schema, d: Path, since, until) -> dict[str, list]:
+        cols: list[list] = [[] for _ in schema.fields]
+        if not d.is_dir():
+            return {n: [] for n in schema.names}
+        lo = since if since is not None else 0
+        hi = until if until is not None else 2**32 - 1
+
+        # head first: anything it still holds that a segment already covers is a sealed duplicate
+        head = _read_mapped(d / HEAD) if (d / HEAD).exists() else b""
+        sealed_until = -1
+        for name in self._segment_names(d):
+            first, last = _segment_range(name)
+            sealed_until = max(sealed_until, last)
+            if last < lo or first > hi:
+                continue
+            seg = self._segment(schema, d / name)
+            ts = seg.columns[0]
+            i, j = bisect_left(ts, lo), bisect_right(ts, hi)
+            for out, col in zip(cols, seg.columns):
+                out.extend(col[i:j])
+
+        if head:
+            n = len(head) // schema.record.size
+            head_rows = sorted((r for r in schema.record.iter_unpack(head[:n * schema.record.size])
+                                if lo <= r[0] <= hi and r[0] > sealed_until), key=itemgetter(0))
+            for r in head_rows:
+                for out, v in zip(cols, r):
+                    out.append(v)
+
+        strings = self._table(d)
+        strings.refresh()
+        return {n: list(col) if k == "ts" else [_from_storage(k, v, strings.values) for v in col]
+                for (n, k), col in zip(schema.fields, cols)}
+
+    def bounds(self, schema: Schema, service_id: int) -> tuple[int, int] | None:
+        """(oldest, newest) timestamp stored for a series, without decoding segments."""
+        d = self._dir(schema, service_id)
+        if not d.is_dir():
+            return None
+        ranges = [_segment_range(n) for n in self._segment_names(d)]
+        try:
+            head = (d / HEAD).read_bytes()
+        except FileNotFoundError:
+            head = b""
+        n = len(head) // schema.record.size
+        ts = [r[0] for r in schema.record.iter_unpack(head[:n * schema.record.size])]
+        if ts:
+            ranges.append((min(ts), max(ts)))
+        if not ranges:
+            return None
+        return min(a for a, _ in ranges), max(b for _, b in ranges)
+
+    def last(self, schema: Schema, service_id: int) -> dict[str, Any] | None:
+        b = self.bounds(schema, service_id)
+        if b is None:
+            return None
+        rows = list(self.rows(schema, service_id, b[1], b[1]))
+        return rows[-1] if rows else None
+
+    def iter_scan(self, schema: Schema, service_id: int, since=None, until=None, *, window=86400):
+        """scan() in time windows, so long ranges stream instead of loading at once."""
+        b = self.bounds(schema, service_id)
+        if b is None:
+            return
+        lo = max(b[0], since) if since is not None else b[0]
+        hi = min(b[1], until) if until is not None else b[1]
+        while lo <= hi:
+            cols = self.scan(schema, service_id, lo, min(hi, lo + window - 1))
+            if cols[schema.names[0]]:
+                yield cols
+            lo += window
+
+    def rows(self, schema: Schema, service_id: int, since=None, until=None) -> Iterator[dict[str, Any]]:
+        cols = self.scan(schema, service_id, since, until)
+        names = schema.names
+        for values in zip(*(cols[n] for n in names)):
+            yield dict(zip(names, values))
+
+    # ---- compaction ----
+
+    def compact(self, schema: Schema | None = None):
+        """Seal full heads and merge small segments; safe to run from any worker."""
+        for sch in ([schema] if schema else [CHECKS, METRICS]):
+            for sid in self.service_ids(sch):
+                d = self._dir(sch, sid)
+                with self._locked(d):
+                    self._seal(sch, d)
+                    self._merge(sch, d)
+
+    def _write_segment(self, schema: Schema, d: Path, columns: list) -> str:
+        name = f"seg-{columns[0][0]}-{columns[0][-1]}.wfg"
+        tmp = d / f".{name}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_encode_segment(schema, columns))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, d / name)
+        return name
+
+    def _seal(self, schema: Schema, d: Path):
+        path = d / HEAD
+        try:
+            raw = path.read_bytes()
+        except FileNotFoundError:
+            return
+        n = len(raw) // schema.record.size
+        if n < self.seal_rows:
+            return
+        names = self._segment_names(d)
+        sealed_until = max((_segment_range(x)[1] for x in names), default=-1)
+        recs = sorted((r for r in schema.record.iter_unpack(raw[:n * schema.record.size]) if r[0] > sealed_until),
+                      key=itemgetter(0))  # stable: same-second rows keep their append order
+        # The newest second stays in the head: rows still arriving for it must not
+        # land on both sides of a segment boundary, where reads would drop them.
+        cut = bisect_left([r[0] for r in recs], recs[-1][0]) if recs else 0
+        if not cut and len(recs) == n:
+            return  # a single second so far; nothing to seal yet
+        if cut:
+            self._write_segment(schema, d, [list(c) for c in zip(*recs[:cut])])
+        # readers holding the old head keep their mapping and skip what is sealed now
+        if recs[cut:]:
+            tmp = d / f".{HEAD}.tmp"
+            tmp.write_bytes(b"".join(schema.record.pack(*r) for r in recs[cut:]))
+            os.replace(tmp, path)
+        else:
+            path.unlink()
+
+    def _merge(self, schema: Schema, d: Path):
+        names = self._segment_names(d)
+        group, rows = [], 0
+        for name in names + [None]:
+            n = _segment_rows(d / name) if name else None
+            if n is not None and rows + n <= self.max_segment_rows:
+                group.append(name)
+                rows += n
+                continue
+            if len(group) >= self.merge_fanin:
+                segs = [self._segment(schema, d / g) for g in group]
+                merged = [array(c.typecode) for c in segs[0].columns]
+                for seg in segs:
+                    for out, col in zip(merged, seg.columns):
+                        out.extend(col)
+                new = self._write_segment(schema, d, merged)
+                for old in group:
+                    if old != new:
+                        (d / old).unlink(missing_ok=True)
+            group, rows = ([name], n) if name else ([], 0)
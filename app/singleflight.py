@@ -0,0 +1,57 @@
+import threading
+import time
+from typing import Any, Callable
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: BaseException | None = None
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key onto one computation.
+
+    While a call for `key` is running, other callers wait for it and get the
+    same result (or exception). A result younger than `min_interval` seconds is
+    handed out again without recomputing.
+    """
+
+    def __init__(self, *, min_interval: float = 0.0):
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._calls: dict[str, _Call] = {}
+        self._last: dict[str, tuple[float, Any]] = {}
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            last = self._last.get(key)
+            if last and (time.monotonic() - last[0]) < self.min_interval:
+                return last[1]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            with self._lock:
+                self._last[key] = (time.monotonic(), call.result)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def forget(self, key: str):
+        """Drop the cached result so the next call recomputes."""
+        with self._lock:
+            self._last.pop(key, None)
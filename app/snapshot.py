@@ -0,0 +1,301 @@
+import fcntl
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Any
+
+MAGIC = b"WFS2"
+
+# magic, restored_at (boot-time restore, 0 = none), seq (seqlock counter), count, capacity,
+# health_checked_at, metrics_checked_at
+HEADER = struct.Struct("<4sIQIIqq")
+
+# One fixed-width slot per service. Missing numbers are stored as NaN / -1.
+SLOT = struct.Struct(
+    "<64s"   # slug
+    "64s"    # beszel_host
+    "64s"    # beszel_container
+    "q"      # health checked_at (0 = never)
+    "b"      # ok (-1 unknown, 0 down, 1 up)
+    "?"      # suppressed (probe skipped: host offline / parent down)
+    "2x"
+    "i"      # status_code (-1 none)
+    "i"      # latency_ms (-1 none)
+    "i"      # dns_ms (-1 none)
+    "192s"   # error (utf-8, truncated)
+    "q"      # metrics checked_at (0 = never)
+    "dddd"   # host cpu, mem_used, mem_total, mem_percent
+    "dd"     # container cpu, mem_used
+    "16s"    # container state
+    "48s"    # container uptime
+)
+
+def _enc(s: str | None, size: int) -> bytes:
+    b = (s or "").encode("utf-8")[:size]
+    # don't leave half a multibyte char at the cut
+    return b.decode("utf-8", "ignore").encode("utf-8")
+
+def _dec(b: bytes) -> str | None:
+    s = b.rstrip(b"\0").decode("utf-8", "ignore")
+    return s or None
+
+def _f(v) -> float:
+    try:
+        return float(v) if v is not None else math.nan
+    except (TypeError, ValueError):
+        return math.nan
+
+def _nf(v: float):
+    return None if math.isnan(v) else v
+
+def _i(v) -> int:
+    return int(v) if v is not None else -1
+
+def _ni(v: int):
+    return None if v < 0 else v
+
+def _pack(slot: dict[str, Any]) -> bytes:
+    h = slot.get("health") or {}
+    m = slot.get("metrics") or {}
+    sysm = m.get("system") or {}
+    ctr = m.get("container") or {}
+    ok = h.get("ok")
+    return SLOT.pack(
+        _enc(slot["id"], 64), _enc(slot.get("beszel_host"), 64), _enc(slot.get("beszel_container"), 64),
+        int(h.get("checked_at") or 0), -1 if ok is None else int(bool(ok)), bool(h.get("suppressed")),
+        _i(h.get("status_code")), _i(h.get("latency_ms")), _i(h.get("dns_ms")), _enc(h.get("error"), 192),
+        int(m.get("checked_at") or 0),
+        _f(sysm.get("cpu")), _f(sysm.get("mem_used")), _f(sysm.get("mem_total")), _f(sysm.get("mem_percent")),
+        _f(ctr.get("cpu")), _f(ctr.get("mem_used")),
+        _enc(ctr.get("state"), 16), _enc(ctr.get("uptime"), 48),
+    )
+
+def _unpack(buf, offset: int) -> dict[str, Any]:
+    (slug, host, container, h_at, ok, suppressed, status, latency, dns, error, m_at,
+     cpu, mu, mt, mp, ccpu, cmu, state, uptime) = SLOT.unpack_from(buf, offset)
+    slot = {"id": _dec(slug), "beszel_host": _dec(host), "beszel_container": _dec(container),
+            "health": None, "metrics": None}
+    if h_at:
+        slot["health"] = {"id": slot["id"], "ok": ok == 1, "status_code": _ni(status),
+                          "latency_ms": _ni(latency), "dns_ms": _ni(dns), "error": _dec(error),
+                          "checked_at": h_at, "suppressed": suppressed}
+    if m_at:
+        slot["metrics"] = {
+            "checked_at": m_at,
+            "system": {"cpu": _nf(cpu), "mem_used": _nf(mu), "mem_total": _nf(mt), "mem_percent": _nf(mp)},
+            "container": {"state": _dec(state), "uptime": _dec(uptime), "cpu": _nf(ccpu), "mem_used": _nf(cmu)},
+        }
+    return slot
+
+class SnapshotStore:
+    """Latest health + metrics per service in a memory-mapped file shared by all workers.
+
+    Exactly one process (whoever holds the flock on `<path>.lock`) publishes;
+    every worker reads straight out of the mapping. Writes are bracketed by a
+    seqlock counter so readers retry instead of seeing a half-written table.
+    Each publish is also copied to `persist_path` so `restore()` can bring the
+    table back after the mapping itself is gone (container restart).
+    """
+
+    def __init__(self, path: str, *, capacity=512, persist_path: str | None = None):
+        self.path = path
+        self.persist_path = persist_path
+        self.capacity = capacity
+        self.size = HEADER.size + SLOT.size * capacity
+        self._mm = None
+        self._lock_fd = None
+        self._map_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._state: dict[str, dict[str, Any]] | None = None  # writer-side copy
+        self._health_at = 0
+        self._metrics_at = 0
+        self._restored_at = 0
+
+    def _map(self):
+        if self._mm is not None:
+            return self._mm
+        with self._map_lock:
+            if self._mm is None:
+                self._mm = self._open()
+        return self._mm
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            return mmap.mmap(fd, self.size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+
+    # ---- writer election ----
+    @property
+    def is_writer(self) -> bool:
+        return self._lock_fd is not None
+
+    def try_acquire_writer(self) -> bool:
+        """Non-blocking; the lock is held for the life of the process."""
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(self.path + ".lock", os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        # Pick up what the previous writer left behind
+        snap = self.read()
+        self._state = {s["id"]: s for s in snap["services"]}
+        self._health_at = snap["health_checked_at"]
+        self._metrics_at = snap["metrics_checked_at"]
+        self._restored_at = snap["restored_at"]
+        return True
+
+    # ---- reading ----
+    def read(self) -> dict[str, Any]:
+        """The current table; empty if there is none or the writer died mid-publish
+        (the seq stays odd until a new writer publishes), so callers fall back to
+        a round of their own."""
+        mm = self._map()
+        empty = {"health_checked_at": 0, "metrics_checked_at": 0, "restored_at": 0, "services": []}
+        deadline = time.monotonic() + 0.05  # a publish takes well under a millisecond
+        attempt = 0
+        while True:
+            magic, restored_at, seq1, count, capacity, health_at, metrics_at = HEADER.unpack_from(mm, 0)
+            if magic != MAGIC:
+                return empty
+            attempt += 1
+            if not seq1 & 1:
+                count = min(count, capacity, self.capacity)
+                services = [_unpack(mm, HEADER.size + i * SLOT.size) for i in range(count)]
+                seq2 = HEADER.unpack_from(mm, 0)[2]
+                if seq1 == seq2:
+                    return {"health_checked_at": health_at, "metrics_checked_at": metrics_at,
+                            "restored_at": restored_at, "services": services}
+            if time.monotonic() > deadline:
+                return empty
+            if attempt > 10:
+                time.sleep(0)
+
+    # ---- writing ----
+    def _publish(self):
+        mm = self._map()
+        slots = list(self._state.values())[:self.capacity]
+        seq = HEADER.unpack_from(mm, 0)[2] if mm[:4] == MAGIC else 0
+        if seq & 1:
+            seq += 1  # previous writer died mid-write
+        HEADER.pack_into(mm, 0, MAGIC, self._restored_at, seq + 1, 0, self.capacity,
+                         self._health_at, self._metrics_at)
+        for i, slot in enumerate(slots):
+            mm[HEADER.size + i * SLOT.size: HEADER.size + (i + 1) * SLOT.size] = _pack(slot)
+        HEADER.pack_into(mm, 0, MAGIC, self._restored_at, seq + 2, len(slots), self.capacity,
+                         self._health_at, self._metrics_at)
+        if self.persist_path:
+            self._persist(mm[:HEADER.size + len(slots) * SLOT.size])
+
+    def _persist(self, data: bytes):
+        tmp = f"{self.persist_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self.persist_path)
+        except OSError:
+            pass  # only costs us the warm start after the next restart
+
+    def _load_persisted(self) -> dict[str, Any] | None:
+        try:
+            with open(self.persist_path, "rb") as f:
+                buf = f.read()
+        except (OSError, TypeError):
+            return None
+        if len(buf) < HEADER.size:
+            return None
+        magic, _, _, count, _, health_at, metrics_at = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or len(buf) != HEADER.size + count * SLOT.size:
+            return None  # different layout or torn copy; fall back
+        services = [_unpack(buf, HEADER.size + i * SLOT.size) for i in range(min(count, self.capacity))]
+        return {"health_checked_at": health_at, "metrics_checked_at": metrics_at, "services": services}
+
+    def restore(self, load_fallback=None) -> bool:
+        """Writer only: refill an empty table (fresh boot) from the persisted copy,
+        else from `load_fallback()` (same shape as read()). The restored state keeps
+        its old checked_at times; readers see `restored_at` to know it is stale."""
+        if not self.is_writer:
+            return False
+        with self._write_lock:
+            if self._health_at or self._metrics_at:
+                return False
+            snap = self._load_persisted() or (load_fallback() if load_fallback else None)
+            if not snap or not snap["services"]:
+                return False
+            self._state = {s["id"]: s for s in snap["services"]}
+            self._health_at = snap["health_checked_at"]
+            self._metrics_at = snap["metrics_checked_at"]
+            self._restored_at = int(time.time())
+            self._publish()
+            return True
+
+    def _sync_services(self, services):
+        # services: iterable of (slug, beszel_host, beszel_container); drops ones no longer enabled
+        old = self._state or {}
+        self._state = {}
+        for slug, host, container in services:
+            slot = old.get(slug) or {"id": slug, "health": None, "metrics": None}
+            slot["beszel_host"] = host
+            slot["beszel_container"] = container
+            self._state[slug] = slot
+
+    def publish_health(self, services, results: list[dict[str, Any]], checked_at: int):
+        if not self.is_writer:
+            return
+        with self._write_lock:
+            self._sync_services(services)
+            for r in results:
+                if r["id"] in self._state:
+                    self._state[r["id"]]["health"] = r
+            self._health_at = checked_at
+            self._publish()
+
+    def publish_metrics(self, services, results: list[dict[str, Any]], checked_at: int, errors: list[str] = ()):
+        if not self.is_writer:
+            return
+        with self._write_lock:
+            self._write_errors(checked_at, list(errors))
+            self._sync_services(services)
+            for r in results:
+                if r["id"] in self._state:
+                    self._state[r["id"]]["metrics"] = {"checked_at": checked_at,
+                                                       "system": r.get("system") or {},
+                                                       "container": r.get("container") or {}}
+            self._metrics_at = checked_at
+            self._publish()
+
+    # ---- round errors (variable length, so a JSON sidecar instead of slots) ----
+    @property
+    def _errors_path(self) -> str:
+        return self.path + ".errors"
+
+    def _write_errors(self, checked_at: int, errors: list[str]):
+        # written before the table, so a reader that sees the new checked_at finds these
+        tmp = f"{self._errors_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"checked_at": checked_at, "errors": errors}, f)
+            os.replace(tmp, self._errors_path)
+        except OSError:
+            pass
+
+    def metrics_errors(self, checked_at: int) -> list[str]:
+        """Errors of the metrics round published at `checked_at` ([] if unknown)."""
+        try:
+            with open(self._errors_path) as f:
+                doc = json.load(f)
+        except (OSError, ValueError):
+            return []
+        return (doc.get("errors") or []) if doc.get("checked_at") == checked_at else []
@@ -53,13 +53,14 @@ function setBar(fillEl, pct) {
   else if (p != null && p >= WARN_PCT) fillEl.classList.add("warn");
 }
 
-function setSummary(summary) {
+function setSummary(summary, stale) {
   const text = document.getElementById("summary-text");
   const dot = document.getElementById("summary-dot");
   const pill = document.getElementById("summary-pill");
 
   const { total, up, down, checked_at } = summary;
-  text.textContent = `${up}/${total} up • ${down} down • ${formatTime(checked_at)}`;
+  text.textContent = `${up}/${total} up • ${down} down • ${formatTime(checked_at)}${stale ? " • last known" : ""}`;
+  pill.classList.toggle("stale", !!stale);
 
   dot.classList.remove("up", "down", "neutral");
   if (down > 0) dot.classList.add("down");
@@ -103,13 +104,16 @@ function updateHealthCard(result) {
   lastcheck.textContent = result.checked_at ? formatTime(result.checked_at) : "—";
 }
 
+function applyHealth(data) {
+  // stale: last known state from before a restart, until the first fresh round
+  setSummary(data.summary, data.stale);
+  for (const r of data.results) updateHealthCard(r);
+}
+
 async function fetchHealth() {
   const res = await fetch("/api/health", { cache: "no-store" });
   if (!res.ok) throw new Error(`Health HTTP ${res.status}`);
-  const data = await res.json();
-
-  setSummary(data.summary);
-  for (const r of data.results) updateHealthCard(r);
+  applyHealth(await res.json());
 }
 
 /* -------- Host grouping -------- */
@@ -257,11 +261,7 @@ function updateHostKpis(metricsResults) {
   });
 }
 
-async function fetchMetrics() {
-  const res = await fetch("/api/metrics", { cache: "no-store" });
-  if (!res.ok) throw new Error(`Metrics HTTP ${res.status}`);
-  const data = await res.json();
-
+function applyMetrics(data) {
   if (Array.isArray(data.results)) {
     for (const r of data.results) {
       updateMetricsCard(r.id, r.system, r.container);
@@ -274,6 +274,12 @@ async function fetchMetrics() {
   }
 }
 
+async function fetchMetrics() {
+  const res = await fetch("/api/metrics", { cache: "no-store" });
+  if (!res.ok) throw new Error(`Metrics HTTP ${res.status}`);
+  applyMetrics(await res.json());
+}
+
 /* -------- Dozzle logs -------- */
 
 function openDozzleLogs(dozzleBase, containerName) {
@@ -283,7 +289,55 @@ function openDozzleLogs(dozzleBase, containerName) {
   window.open(url, "_blank", "noopener");
 }
 
+const LOG_PREVIEW_MAX_LINES = 1000;
+let logSource = null;
+
+function closeLogSource() {
+  if (logSource) { logSource.close(); logSource = null; }
+}
+
+function closeLogPreview() {
+  closeLogSource();
+  const panel = document.getElementById("log-preview");
+  if (panel) panel.hidden = true;
+}
+
+function appendLogLine(pre, text, cls) {
+  const line = document.createElement("div");
+  line.textContent = text;
+  if (cls) line.className = cls;
+  const stick = pre.scrollTop + pre.clientHeight >= pre.scrollHeight - 8;
+  pre.appendChild(line);
+  while (pre.childElementCount > LOG_PREVIEW_MAX_LINES) pre.removeChild(pre.firstElementChild);
+  if (stick) pre.scrollTop = pre.scrollHeight;
+}
+
+function openLogPreview(serviceId, title, dozzleBase, containerName) {
+  const panel = document.getElementById("log-preview");
+  if (!panel) return openDozzleLogs(dozzleBase, containerName);
+
+  closeLogPreview();
+  const pre = panel.querySelector("[data-log-lines]");
+  pre.textContent = "";
+  panel.querySelector("[data-log-title]").textContent = title;
+  panel.querySelector("[data-log-open]").onclick = () => openDozzleLogs(dozzleBase, containerName);
+  panel.hidden = false;
+
+  logSource = new EventSource(`/api/logs/${encodeURIComponent(serviceId)}`);
+  logSource.onmessage = (ev) => appendLogLine(pre, JSON.parse(ev.data));
+  logSource.addEventListener("dropped", (ev) => appendLogLine(pre, `… ${ev.data} lines skipped`, "log-note"));
+  logSource.addEventListener("capped", () => { appendLogLine(pre, "… line cap reached, reopen to continue", "log-note"); closeLogSource(); });
+  logSource.addEventListener("closed", (ev) => {
+    const err = JSON.parse(ev.data || '""');
+    appendLogLine(pre, err ? `… stream closed: ${err}` : "… stream closed", "log-note");
+    closeLogSource();
+  });
+  logSource.onerror = () => { appendLogLine(pre, "… log stream unavailable", "log-note"); closeLogSource(); };
+}
+
 document.addEventListener("click", (e) => {
+  if (e.target.closest("[data-log-close]")) { closeLogPreview(); return; }
+
   const btn = e.target.closest("[data-logs]");
   if (!btn) return;
 
@@ -293,9 +347,13 @@ document.addEventListener("click", (e) => {
   const card = btn.closest(".card");
   if (!card) return;
 
-  openDozzleLogs(card.dataset.dozzleBase, card.dataset.beszelContainer);
+  const container = card.dataset.dozzleContainer || card.dataset.beszelContainer;
+  const name = card.querySelector(".name")?.textContent || card.dataset.serviceId;
+  openLogPreview(card.dataset.serviceId, `${name} • ${container}`, card.dataset.dozzleBase, container);
 });
 
+document.addEventListener("keydown", (e) => { if (e.key === "Escape") closeLogPreview(); });
+
 /* -------- Refresh loop -------- */
 
 async function refreshAll() {
@@ -318,6 +376,11 @@ document.getElementById("refresh-btn").addEventListener("click", refreshAll);
 // Build host groups once on load (cards exist already)
 groupCardsByHost();
 
+// Paint the server-rendered snapshot right away, then refresh
+const initial = window.DASHBOARD_INITIAL || {};
+if (initial.health) applyHealth(initial.health);
+if (initial.metrics) applyMetrics(initial.metrics);
+
 // Initial load + polling
 refreshAll();
 setInterval(refreshAll, window.DASHBOARD_POLL_MS || 5000);
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import threading
+from typing import Any
+
+from .db import db, AppSetting, Theme, User
+
+ACTIVE_THEME_KEY = "active_theme_slug"
+
+class CompiledTheme:
+    __slots__ = ("key", "css", "digest")
+
+    def __init__(self, key, css: str):
+        self.key = key  # (theme id, updated_at) or None for "no theme"
+        self.css = css
+        self.digest = hashlib.sha256(css.encode("utf-8")).hexdigest()[:12]
+
+class ThemeCache:
+    """user id -> compiled theme CSS, plus parsed tokens per theme version.
+
+    A user's theme is their `User.active_theme_id`, else the site default
+    (AppSetting `active_theme_slug`). Entries are keyed by (theme id,
+    updated_at), looked up with two or three primary-key queries, so an edit or
+    switch made in another worker is noticed on the next page render and only
+    that user's (or that theme's) entry is rebuilt. The CSS is served under its
+    content hash, which lets browsers and proxies cache it for good.
+    """
+
+    def __init__(self, allowed_tokens: set[str]):
+        self.allowed = allowed_tokens
+        self._lock = threading.Lock()
+        self._by_user: dict[int | None, tuple[CompiledTheme, bool]] = {}  # -> (css, from site default)
+        self._by_digest: dict[str, CompiledTheme] = {}
+        self._compiled: dict[Any, CompiledTheme] = {}
+        self._tokens: dict[int, tuple[Any, dict[str, str]]] = {}
+
+    # ---- tokens ----
+
+    def tokens(self, theme: Theme) -> dict[str, str]:
+        """Parsed tokens_json, parsed once per theme version."""
+        with self._lock:
+            hit = self._tokens.get(theme.id)
+        if hit and hit[0] == theme.updated_at:
+            return hit[1]
+        try:
+            tokens = json.loads(theme.tokens_json or "{}")
+        except Exception:
+            tokens = {}
+        if not isinstance(tokens, dict):
+            tokens = {}
+        with self._lock:
+            self._tokens[theme.id] = (theme.updated_at, tokens)
+        return tokens
+
+    # ---- resolution ----
+
+    def _source(self, user_id: int | None):
+        """((id, updated_at) or None, from_default) for the theme this user sees,
+        without loading tokens_json."""
+        if user_id is not None:
+            row = db.session.query(User.active_theme_id).filter_by(id=user_id).first()
+            if row and row[0]:
+                t = db.session.query(Theme.id, Theme.updated_at).filter_by(id=row[0]).first()
+                if t:
+                    return tuple(t), False
+        setting = AppSetting.query.get(ACTIVE_THEME_KEY)
+        if setting:
+            t = db.session.query(Theme.id, Theme.updated_at).filter_by(slug=setting.value).first()
+            if t:
+                return tuple(t), True
+        return None, True
+
+    def _compile(self, key) -> CompiledTheme:
+        theme = Theme.query.get(key[0]) if key else None
+        lines = []
+        if theme:
+            for k, v in self.tokens(theme).items():
+                if k in self.allowed:
+                    safe_val = str(v).replace("\n", " ").replace("\r", " ").strip()
+                    lines.append(f"  {k}: {safe_val};")
+        css = ":root{\n" + "\n".join(lines) + "\n}\n"
+        if theme and theme.mode in ("light", "dark"):
+            css += f":root{{ color-scheme: {theme.mode}; }}\n"
+        return CompiledTheme(key, css)
+
+    def for_user(self, user_id: int | None) -> CompiledTheme:
+        key, from_default = self._source(user_id)
+        with self._lock:
+            hit = self._by_user.get(user_id)
+            if hit is not None and hit[0].key == key:
+                return hit[0]
+            compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled = self._compile(key)
+        with self._lock:
+            if key is not None:
+                # an older version of this theme is dead weight now
+                for old in [k for k in self._compiled if k and k[0] == key[0] and k != key]:
+                    self._by_digest.pop(self._compiled.pop(old).digest, None)
+            self._compiled[key] = compiled
+            self._by_digest[compiled.digest] = compiled
+            self._by_user[user_id] = (compiled, from_default)
+        return compiled
+
+    def by_digest(self, digest: str) -> CompiledTheme | None:
+        with self._lock:
+            return self._by_digest.get(digest)
+
+    # ---- invalidation (this worker; others notice via the (id, updated_at) key) ----
+
+    def invalidate_user(self, user_id: int | None):
+        with self._lock:
+            self._by_user.pop(user_id, None)
+
+    def invalidate_theme(self, theme_id: int):
+        with self._lock:
+            self._tokens.pop(theme_id, None)
+            for key in [k for k in self._compiled if k and k[0] == theme_id]:
+                self._by_digest.pop(self._compiled.pop(key).digest, None)
+            for uid in [u for u, (c, _) in self._by_user.items() if c.key and c.key[0] == theme_id]:
+                del self._by_user[uid]
+
+    def invalidate_default(self):
+        """Site default changed: drop only the entries that came from it."""
+        with self._lock:
+            for uid in [u for u, (_, from_default) in self._by_user.items() if from_default]:
+                del self._by_user[uid]
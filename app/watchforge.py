@@ -1,16 +1,30 @@
 import json
 import time
-from flask import Flask, flash, render_template, request, redirect, url_for, session, jsonify, abort, Response
+from datetime import datetime
+from flask import Flask, flash, render_template, request, redirect, url_for, session, jsonify, abort, Response, stream_with_context
 from werkzeug.security import check_password_hash, generate_password_hash
-from .db import db, Service, ServiceSecret, CheckResult, MetricsSnapshot, Theme, AppSetting
+from .db import db, ensure_columns, ensure_indexes, Service, ServiceSecret, CheckResult, MetricsSnapshot, StateInterval, Theme, AppSetting, User
 
 from apscheduler.schedulers.background import BackgroundScheduler # pyright: ignore[reportMissingImports]
 
 from .config import Settings
 from .db import db, Service, ServiceSecret, CheckResult, MetricsSnapshot, Theme
 from .crypto import Crypto
-from .beszel import BeszelClient, normalize_name
+from .federation import BeszelFederation, fetch_hub_metrics
+from .dependencies import HostStates, ProbeSuppressor, order_by_dependency
 from .health import run_health_check
+from .dnscache import DNSCache
+from .history import record_check, record_metrics, timeline
+from . import history
+from .segments import CHECKS, METRICS
+from .logtail import DozzleDirectory, LogTailHub
+from .assets import StaticAssets
+from .resolution import BeszelIndex
+from .snapshot import SnapshotStore
+from . import export
+from .singleflight import SingleFlight
+from .profiling import Profiler, collapsed, pstats_dump
+from .themecache import ThemeCache
 from pathlib import Path
 import re
 
@@ -29,16 +43,50 @@ def bootstrap():
         db.init_app(app)
 
     # init things that rely on Settings only (no DB queries here)
-    global crypto, beszel, _ADMIN_HASH
+    global crypto, dns_cache, beszel_hubs, beszel_index, host_states, suppressor, log_tails, dozzle_dir, assets, snapshot, rounds, profiler, _ADMIN_HASH
     crypto = Crypto(Settings.ENCRYPTION_KEY)
-    beszel = BeszelClient(Settings.BESZEL_BASE_URL, Settings.BESZEL_EMAIL, Settings.BESZEL_PASSWORD)
+    dns_cache = DNSCache(default_ttl=Settings.DNS_TTL_SECONDS, negative_ttl=Settings.DNS_NEGATIVE_TTL_SECONDS,
+                         max_stale=Settings.DNS_MAX_STALE_SECONDS)
+    beszel_hubs = BeszelFederation.from_settings(Settings.BESZEL_SOURCES,
+                                                 timeout=Settings.BESZEL_TIMEOUT_SECONDS,
+                                                 deadline=Settings.BESZEL_HUB_DEADLINE_SECONDS)
+    beszel_index = BeszelIndex(beszel_hubs, ttl=Settings.BESZEL_INDEX_TTL_SECONDS)
+    host_states = HostStates()
+    suppressor = ProbeSuppressor(host_states, canary_seconds=Settings.CANARY_SECONDS,
+                                 host_state_max_age=3 * max(1, Settings.POLL_METRICS_SECONDS))
+    snapshot = SnapshotStore(Settings.SNAPSHOT_PATH, capacity=Settings.SNAPSHOT_CAPACITY,
+                             persist_path=Settings.SNAPSHOT_PERSIST_PATH)
+    # API fallbacks and the scheduler share one in-flight probe/metrics round per worker
+    rounds = SingleFlight(min_interval=Settings.MIN_RECOMPUTE_SECONDS)
+    log_tails = LogTailHub(max_lines=Settings.LOG_TAIL_LINES,
+                           max_line_bytes=Settings.LOG_TAIL_MAX_LINE_BYTES,
+                           idle_timeout=Settings.LOG_TAIL_IDLE_SECONDS)
+    dozzle_dir = DozzleDirectory(Settings.DOZZLE_BASE_URL) if Settings.DOZZLE_BASE_URL else None
+    if "watchforge.assets" not in app.extensions:
+        assets = StaticAssets(app, min_size=Settings.COMPRESS_MIN_BYTES)
+        app.extensions["watchforge.assets"] = assets
+    if "watchforge.profiler" not in app.extensions:
+        # SSE and export responses stream for minutes; profiling them says nothing useful
+        profiler = Profiler(app, directory=Settings.PROFILE_DIR, max_profiles=Settings.PROFILE_MAX,
+                            interval=Settings.PROFILE_INTERVAL_MS / 1000,
+                            sample_rate=Settings.PROFILE_SAMPLE_PCT / 100,
+                            skip_endpoints={"static", "api_logs", "api_export_checks", "api_export_metrics"})
+        app.extensions["watchforge.profiler"] = profiler
     _ADMIN_HASH = generate_password_hash(Settings.ADMIN_PASSWORD) if Settings.ADMIN_PASSWORD else None
 
     # DB work must be inside app context
     with app.app_context():
         db.create_all()
+        ensure_columns("beszel_resolutions", {"source": "VARCHAR(64)"})
+        ensure_columns("services", {"depends_on": "VARCHAR(64)"})
+        ensure_columns("check_results", {"dns_ms": "INTEGER"})
+        ensure_indexes(CheckResult, MetricsSnapshot)
         seed_starter_themes()
 
+        # Fresh boot (empty shared table): bring back the last known state until the first rounds land
+        if snapshot.try_acquire_writer():
+            snapshot.restore(lambda: history.last_known(Service.query.filter_by(enabled=True).all()))
+
 def _slugify(s: str) -> str:
     s = (s or "").strip().lower()
     s = re.sub(r"[^a-z0-9]+", "-", s)
@@ -121,11 +169,29 @@ THEME_TOKENS_ALLOWED = {
     "--warn-pct","--danger-pct"
 }
 
+# Compiled /theme.css per user, served under a content hash
+theme_cache = ThemeCache(THEME_TOKENS_ALLOWED)
+
 def require_login():
     if not session.get("logged_in"):
         return redirect(url_for("login"))
     return None
 
+def _session_user_id() -> int | None:
+    try:
+        return int(session["user_id"]) if session.get("logged_in") and session.get("user_id") is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def _is_admin() -> bool:
+    user = User.query.get(_session_user_id() or 0)
+    return user is not None and user.username == Settings.ADMIN_USER
+
+@app.context_processor
+def _theme_css_url():
+    # Every page links the CSS by content hash, so it can be cached for good
+    return {"theme_css_url": url_for("theme_css", v=theme_cache.for_user(_session_user_id()).digest)}
+
 @app.route("/login", methods=["GET", "POST"])
 def login():
     if request.method == "GET":
@@ -157,7 +223,13 @@ def dashboard():
     if gate:
         return gate
     services = Service.query.filter_by(enabled=True).order_by(Service.group.asc().nullslast(), Service.name.asc()).all()
-    return render_template("dashboard.html", services=services, warn_pct=Settings.WARN_PCT, danger_pct=Settings.DANGER_PCT)
+    snap = snapshot.read()
+    initial_state = {
+        "health": _health_from_snapshot(snap, require_fresh=False),
+        "metrics": _metrics_from_snapshot(snap, require_fresh=False),
+    }
+    return render_template("dashboard.html", services=services, warn_pct=Settings.WARN_PCT, danger_pct=Settings.DANGER_PCT,
+                           Settings=Settings, initial_state=initial_state)
 
 @app.route("/services")
 def services_page():
@@ -232,7 +304,9 @@ def themes_list():
     gate = require_login()
     if gate: return gate
 
-    active_slug = get_active_theme_slug()
+    user = User.query.get(_session_user_id() or 0)
+    active = Theme.query.get(user.active_theme_id) if user and user.active_theme_id else None
+    active_slug = active.slug if active else get_active_theme_slug()
     themes = Theme.query.order_by(Theme.name.asc()).all()
     return render_template("themes.html", themes=themes, active_slug=active_slug)
 
@@ -255,13 +329,7 @@ def themes_edit(theme_id: int):
     if owner_id is not None and owner_id != user_id:
         abort(403)
 
-    tokens = {}
-    try:
-        tokens = json.loads(theme.tokens_json or "{}")
-    except Exception:
-        tokens = {}
-
-    return render_template("themes_editor.html", theme=theme, tokens_json=tokens)
+    return render_template("themes_editor.html", theme=theme, tokens_json=theme_cache.tokens(theme))
 
 
 @app.route("/themes/create", methods=["POST"])
@@ -345,6 +413,7 @@ def themes_update(theme_id: int):
         theme.created_by_user_id = user_id
 
     db.session.commit()
+    theme_cache.invalidate_theme(theme.id)
     return jsonify({"ok": True})
 
 
@@ -411,12 +480,16 @@ def themes_delete(theme_id: int):
     # ---------------------------------------------
 
     active_slug = get_active_theme_slug()
-    if active_slug and theme.slug == active_slug:
+    user = User.query.get(user_id or 0)
+    if (active_slug and theme.slug == active_slug) or (user and user.active_theme_id == theme.id):
         flash("Can't delete the active theme. Activate a different theme first.", "error")
         return redirect(url_for("themes_list"))
 
+    # anyone else using it falls back to the site default
+    User.query.filter_by(active_theme_id=theme.id).update({"active_theme_id": None})
     db.session.delete(theme)
     db.session.commit()
+    theme_cache.invalidate_theme(theme.id)
 
     flash(f'Deleted theme "{theme.name}".', "success")
     return redirect(url_for("themes_list"))
@@ -424,35 +497,20 @@ def themes_delete(theme_id: int):
 @app.route("/theme.css")
 def theme_css():
     # allow unauth; it’s just CSS
-    slug = get_active_theme_slug()
-    theme = Theme.query.filter_by(slug=slug).first() if slug else None
+    v = request.args.get("v")
+    compiled = (theme_cache.by_digest(v) if v else None) or theme_cache.for_user(_session_user_id())
 
-    tokens = {}
-    if theme:
-        try:
-            tokens = json.loads(theme.tokens_json or "{}")
-        except Exception:
-            tokens = {}
+    resp = Response(compiled.css, mimetype="text/css")
+    if v == compiled.digest:
+        # content-addressed: the same URL always means the same bytes, for every user
+        resp.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return resp
 
-    lines = []
-    for k, v in tokens.items():
-        if k in THEME_TOKENS_ALLOWED:
-            safe_val = str(v).replace("\n"," ").replace("\r"," ").strip()
-            lines.append(f"  {k}: {safe_val};")
-
-    css = ":root{\n" + "\n".join(lines) + "\n}\n"
-    if theme and theme.mode in ("light","dark"):
-        css += f":root{{ color-scheme: {theme.mode}; }}\n"
-
-    resp = Response(css, mimetype="text/css")
-
-    # ✅ Per-user / session-dependent CSS should not be shared by caches
-    resp.headers["Cache-Control"] = "no-store, max-age=0"
-    resp.headers["Pragma"] = "no-cache"
-    resp.headers["Expires"] = "0"
+    # bare /theme.css depends on who is asking
+    resp.headers["Cache-Control"] = "no-cache"
     resp.headers["Vary"] = "Cookie"
-
-    return resp
+    resp.set_etag(compiled.digest)
+    return resp.make_conditional(request)
 
 @app.route("/themes/<int:theme_id>/activate", methods=["POST"])
 def activate_theme(theme_id):
@@ -460,7 +518,15 @@ def activate_theme(theme_id):
     if gate: return gate
 
     theme = Theme.query.get_or_404(theme_id)
-    set_active_theme_slug(theme.slug)
+    user = User.query.get(_session_user_id() or 0)
+    if user:
+        user.active_theme_id = theme.id
+        db.session.commit()
+        theme_cache.invalidate_user(user.id)
+    if not user or user.username == Settings.ADMIN_USER:
+        # the admin's choice is also the site default (login page, users without their own pick)
+        set_active_theme_slug(theme.slug)
+        theme_cache.invalidate_default()
     return redirect(url_for("themes_list"))
 
 
@@ -473,7 +539,7 @@ def export_theme(theme_id):
         "author": t.author,
         "description": t.description,
         "mode": t.mode,
-        "tokens": json.loads(t.tokens_json)
+        "tokens": theme_cache.tokens(t)
     })
 
 @app.route("/themes/<int:theme_id>/publish", methods=["POST"])
@@ -495,6 +561,7 @@ def _service_upsert(service_id: int | None = None):
     beszel_host = (form.get("beszel_host") or "").strip() or None
     beszel_container = (form.get("beszel_container") or "").strip() or None
     dozzle_container = (form.get("dozzle_container") or "").strip() or None
+    depends_on = (form.get("depends_on") or "").strip() or None
     enabled = True if form.get("enabled") == "on" else False
 
     basic_user = (form.get("basic_user") or "").strip()
@@ -511,6 +578,9 @@ def _service_upsert(service_id: int | None = None):
     except Exception as e:
         return Response(f"Invalid headers JSON: {e}", status=400)
 
+    if depends_on == slug:
+        return Response("A service can't depend on itself", status=400)
+
     if service_id:
         svc = Service.query.get_or_404(service_id)
     else:
@@ -524,6 +594,7 @@ def _service_upsert(service_id: int | None = None):
     svc.beszel_host = beszel_host
     svc.beszel_container = beszel_container
     svc.dozzle_container = dozzle_container
+    svc.depends_on = depends_on
     svc.enabled = enabled
 
     db.session.add(svc)
@@ -556,6 +627,7 @@ def services_export():
             "beszel_host": s.beszel_host,
             "beszel_container": s.beszel_container,
             "dozzle_container": s.dozzle_container,
+            "depends_on": s.depends_on,
             "enabled": s.enabled
         })
     return jsonify(payload)
@@ -580,24 +652,82 @@ def services_import():
         svc.beszel_host = item.get("beszel_host")
         svc.beszel_container = item.get("beszel_container")
         svc.dozzle_container = item.get("dozzle_container")
+        svc.depends_on = item.get("depends_on")
         svc.enabled = bool(item.get("enabled", True))
         db.session.add(svc)
     db.session.commit()
     return jsonify({"ok": True})
 
 # -------- APIs consumed by dashboard.js --------
-@app.route("/api/health")
-def api_health():
-    gate = require_login()
-    if gate:
-        return Response("unauthorized", status=401)
-
+def _service_keys(services) -> list[tuple]:
+    return [(s.slug, s.beszel_host, s.beszel_container) for s in services]
+
+def _snapshot_fresh(checked_at: int, poll_seconds: int) -> bool:
+    return bool(checked_at) and (time.time() - checked_at) <= max(1, poll_seconds) * Settings.SNAPSHOT_MAX_AGE_POLLS
+
+def _snapshot_restored(snap, checked_at: int) -> bool:
+    # Last known state reloaded at boot that no round has replaced yet
+    restored_at = snap["restored_at"]
+    return (bool(restored_at) and checked_at < restored_at
+            and (time.time() - restored_at) <= Settings.WARM_START_GRACE_SECONDS)
+
+def _health_from_snapshot(snap=None, *, require_fresh=True):
+    snap = snap or snapshot.read()
+    checked_at = snap["health_checked_at"]
+    restored = _snapshot_restored(snap, checked_at)
+    stale = not _snapshot_fresh(checked_at, Settings.POLL_HEALTH_SECONDS) or restored
+    if not checked_at or (require_fresh and stale and not restored):
+        return None
+    results = [s["health"] for s in snap["services"] if s["health"]]
+    up = sum(1 for r in results if r["ok"])
+    total = len(snap["services"])
+    return {
+        "summary": {"total": total, "up": up, "down": total - up, "checked_at": checked_at},
+        "results": results,
+        "stale": stale,
+    }
+
+def _metrics_from_snapshot(snap=None, *, require_fresh=True):
+    snap = snap or snapshot.read()
+    checked_at = snap["metrics_checked_at"]
+    restored = _snapshot_restored(snap, checked_at)
+    stale = not _snapshot_fresh(checked_at, Settings.POLL_METRICS_SECONDS) or restored
+    if not checked_at or (require_fresh and stale and not restored):
+        return None
+    return {
+        "checked_at": checked_at,
+        "stale": stale,
+        "errors": snapshot.metrics_errors(checked_at),
+        "results": [{
+            "id": s["id"],
+            "beszel_host": s["beszel_host"],
+            "beszel_container": s["beszel_container"],
+            "system": s["metrics"]["system"],
+            "container": s["metrics"]["container"],
+        } for s in snap["services"] if s["metrics"]],
+    }
+
+def _health_round() -> dict:
+    """Probe every enabled service, persist, publish to the snapshot."""
     services = Service.query.filter_by(enabled=True).all()
     now = int(time.time())
+    resolved = beszel_index.resolve(services) if beszel_hubs.clients else {}
+    rnd = suppressor.begin_round()
 
     results = []
     up = 0
-    for s in services:
+    for s in order_by_dependency(services):
+        # Host offline in Beszel or parent down: skip the probe unless this is the group's canary
+        reason = rnd.reason(s, resolved.get(s.id))
+        key = reason[0] if reason else None
+        if reason and not rnd.should_probe(key):
+            r = {"ok": False, "status_code": None, "latency_ms": None, "dns_ms": None, "error": reason[1]}
+            rnd.record(s, None, r)
+            results.append({"id": s.slug, **r, "checked_at": now, "suppressed": True})
+            # every round, like a probed service, so rows and intervals modes describe the same history
+            record_check(s.id, now, r)
+            continue
+
         sec = ServiceSecret.query.get(s.id)
         headers = {}
         user = ""
@@ -610,58 +740,92 @@ def api_health():
             except Exception:
                 headers = {}
 
-        r = run_health_check(s.health_url, headers=headers, basic_user=user, basic_pass=pw)
+        r = run_health_check(s.health_url, headers=headers, basic_user=user, basic_pass=pw, dns_cache=dns_cache)
+        rnd.record(s, key, r)
         results.append({
             "id": s.slug,
             "ok": r["ok"],
             "status_code": r["status_code"],
             "latency_ms": r["latency_ms"],
+            "dns_ms": r["dns_ms"],
             "error": r["error"],
             "checked_at": now,
+            "suppressed": False,
         })
         if r["ok"]:
             up += 1
 
-        # persist (optional but you asked for persistence)
-        db.session.add(CheckResult(
-            service_id=s.id,
-            checked_at=now,
-            ok=r["ok"],
-            status_code=r["status_code"],
-            latency_ms=r["latency_ms"],
-            error=r["error"],
-        ))
+        # persist (CheckResult rows or run-length intervals, per DASH_HISTORY_MODE)
+        record_check(s.id, now, r)
 
     db.session.commit()
+    snapshot.publish_health(_service_keys(services), results, now)
 
-    return jsonify({
+    return {
         "summary": {"total": len(services), "up": up, "down": len(services) - up, "checked_at": now},
-        "results": results
-    })
+        "results": results,
+        "stale": False,
+    }
 
-@app.route("/api/metrics")
-def api_metrics():
+@app.route("/api/health")
+def api_health():
+    gate = require_login()
+    if gate:
+        return Response("unauthorized", status=401)
+
+    # Serve the shared snapshot; only probe inline if the poller hasn't published recently
+    return jsonify(_health_from_snapshot() or rounds.do("health", _health_round))
+
+@app.route("/api/history/<slug>")
+def api_history(slug: str):
     gate = require_login()
     if gate:
         return Response("unauthorized", status=401)
 
+    svc = Service.query.filter_by(slug=slug).first_or_404()
+    now = int(time.time())
+    until = request.args.get("until", type=int) or now
+    since = request.args.get("since", type=int) or (until - 24 * 3600)
+
+    return jsonify({"id": svc.slug, "since": since, "until": until, "intervals": timeline(svc.id, since, until)})
+
+def _metrics_round() -> dict:
+    """Fetch Beszel metrics for every enabled service, persist, publish to the snapshot."""
     services = Service.query.filter_by(enabled=True).all()
     now = int(time.time())
 
-    # Build systems lookup by normalized name
-    systems = beszel.list_records("systems", per_page=200, page=1).get("items", [])
-    systems_by_norm = {normalize_name(s.get("name", "")): s for s in systems if s.get("name")}
+    # Service -> Beszel ids come from the persistent index; no per-call system matching
+    resolved = beszel_index.resolve(services)
 
-    out = {"checked_at": now, "errors": [], "results": []}
+    out = {"checked_at": now, "stale": False, "errors": list(beszel_index.hub_errors.values()), "results": []}
 
+    # Fetch every hub at once; each gets only the ids its own services need
+    jobs_by_hub = {}
     for s in services:
-        sys_rec = systems_by_norm.get(normalize_name(s.beszel_host or ""))
-        system_id = sys_rec.get("id") if sys_rec else None
+        res = resolved.get(s.id) or {}
+        if res.get("source") and res.get("system_id"):
+            jobs_by_hub.setdefault(res["source"], []).append((res["system_id"], res.get("container_id")))
+    fetched = beszel_hubs.run(lambda name, client: fetch_hub_metrics(client, jobs_by_hub[name]), list(jobs_by_hub))
+    for name, (hub, err) in fetched.items():
+        if err:
+            out["errors"].append(err)
+        elif hub["statuses"]:
+            host_states.update(name, hub["statuses"])
+
+    for s in services:
+        res = resolved.get(s.id) or {}
+        hub, _ = fetched.get(res.get("source"), (None, None))
+        system_id = res.get("system_id") if hub else None
+        container_id = res.get("container_id") if hub else None
+        c = None
 
         system_metrics = {}
         if system_id:
-            try:
-                ss = beszel.first_record("system_stats", filter_str=f'system="{system_id}"', sort="-created")
+            err = hub["errors"].get(("system_stats", system_id))
+            if err:
+                out["errors"].append(f"system_stats {s.slug}: {err}")
+            else:
+                ss = hub["stats"].get(system_id)
                 stats = (ss or {}).get("stats") or {}
                 # Your schema: cpu%, mu(used GB), m(total GB), mp(percent)
                 cpu = stats.get("cpu")
@@ -674,27 +838,28 @@ def api_metrics():
                     "mem_total": (float(m_gb) * 1024 * 1024 * 1024) if m_gb is not None else None,
                     "mem_percent": mp,
                 }
-            except Exception as e:
-                out["errors"].append(f"system_stats {s.slug}: {e}")
 
         container_metrics = {"state": None, "uptime": None, "cpu": None, "mem_used": None}
-        if system_id and s.beszel_container:
-            try:
-                c = beszel.first_record("containers", filter_str=f'system="{system_id}" && name="{s.beszel_container}"')
-                if c:
-                    # status is uptime string (e.g., "Up 7 days")
-                    container_metrics["uptime"] = c.get("status")
-                    # health: 0 in your sample corresponds to "Healthy" in Beszel UI; adjust if needed
-                    health = c.get("health")
-                    container_metrics["state"] = "Healthy" if health == 0 else "Unhealthy"
-                    container_metrics["cpu"] = c.get("cpu")
-
-                    # memory appears MB in your instance (e.g., 96.88, 255.4)
-                    mem_mb = c.get("memory")
-                    if isinstance(mem_mb, (int, float)):
-                        container_metrics["mem_used"] = float(mem_mb) * 1024 * 1024
-            except Exception as e:
-                out["errors"].append(f"containers {s.slug}: {e}")
+        if container_id:
+            err = hub["errors"].get(("containers", container_id))
+            if err:
+                # most likely the container was recreated under a new record id
+                beszel_index.invalidate()
+                out["errors"].append(f"containers {s.slug}: {err}")
+            else:
+                c = hub["containers"].get(container_id)
+            if c:
+                # status is uptime string (e.g., "Up 7 days")
+                container_metrics["uptime"] = c.get("status")
+                # health: 0 in your sample corresponds to "Healthy" in Beszel UI; adjust if needed
+                health = c.get("health")
+                container_metrics["state"] = "Healthy" if health == 0 else "Unhealthy"
+                container_metrics["cpu"] = c.get("cpu")
+
+                # memory appears MB in your instance (e.g., 96.88, 255.4)
+                mem_mb = c.get("memory")
+                if isinstance(mem_mb, (int, float)):
+                    container_metrics["mem_used"] = float(mem_mb) * 1024 * 1024
 
         out["results"].append({
             "id": s.slug,
@@ -704,43 +869,194 @@ def api_metrics():
             "container": container_metrics
         })
 
-        # persist snapshot
-        db.session.add(MetricsSnapshot(
-            service_id=s.id,
-            checked_at=now,
-            host_cpu=system_metrics.get("cpu"),
-            host_mem_used_bytes=system_metrics.get("mem_used"),
-            host_mem_total_bytes=system_metrics.get("mem_total"),
-            host_mem_pct=system_metrics.get("mem_percent"),
-            ctr_cpu=container_metrics.get("cpu"),
-            ctr_mem_mb=(c.get("memory") if 'c' in locals() and c else None),
-            ctr_uptime=container_metrics.get("uptime"),
-            ctr_health=(c.get("health") if 'c' in locals() and c else None),
-        ))
+        # persist snapshot (MetricsSnapshot row or segment store, per DASH_TS_BACKEND)
+        record_metrics(s.id, now, {
+            "host_cpu": system_metrics.get("cpu"),
+            "host_mem_used_bytes": system_metrics.get("mem_used"),
+            "host_mem_total_bytes": system_metrics.get("mem_total"),
+            "host_mem_pct": system_metrics.get("mem_percent"),
+            "ctr_cpu": container_metrics.get("cpu"),
+            "ctr_mem_mb": (c.get("memory") if c else None),
+            "ctr_uptime": container_metrics.get("uptime"),
+            "ctr_health": (c.get("health") if c else None),
+        })
 
     db.session.commit()
-    return jsonify(out)
+    snapshot.publish_metrics(_service_keys(services), out["results"], now, out["errors"])
+    return out
 
-# -------- Background polling (optional; APIs also persist on-demand) --------
+@app.route("/api/metrics")
+def api_metrics():
+    gate = require_login()
+    if gate:
+        return Response("unauthorized", status=401)
+
+    return jsonify(_metrics_from_snapshot() or rounds.do("metrics", _metrics_round))
+
+@app.route("/api/beszel/resolution")
+def api_beszel_resolution():
+    gate = require_login()
+    if gate:
+        return Response("unauthorized", status=401)
+
+    services = Service.query.filter_by(enabled=True).all()
+    return jsonify(beszel_index.diagnostics(services))
+
+def _export_response(model, columns, time_col, time_end_col=None, *, name: str, schema=None):
+    fmt = (request.args.get("format") or "ndjson").lower()
+    if fmt not in ("ndjson", "csv"):
+        return jsonify({"error": "format must be ndjson or csv"}), 400
+
+    filters = {
+        "services": request.args.getlist("service") or None,
+        "hosts": request.args.getlist("host") or None,
+        "since": request.args.get("since", type=int),
+        "until": request.args.get("until", type=int),
+    }
+    stmt = export.build_query(model, columns, time_col, time_end_col, **filters)
+    # schema: also read samples from the segment store (DASH_TS_BACKEND=segments)
+    rows = export.export_rows(stmt, columns, schema=schema, **filters)
+    if fmt == "csv":
+        gen, mimetype = export.stream_csv(rows, columns), "text/csv"
+    else:
+        gen, mimetype = export.stream_ndjson(rows, columns), "application/x-ndjson"
+
+    resp = Response(stream_with_context(gen), mimetype=mimetype)
+    resp.headers["Content-Disposition"] = f'attachment; filename="{name}.{fmt}"'
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+@app.route("/api/export/checks")
+def api_export_checks():
+    gate = require_login()
+    if gate:
+        return Response("unauthorized", status=401)
+
+    # shape=intervals exports run-length history (the only kind stored in intervals mode)
+    intervals_default = Settings.HISTORY_MODE == "intervals" and history.series is None
+    shape = request.args.get("shape") or ("intervals" if intervals_default else "rows")
+    if shape == "intervals":
+        return _export_response(StateInterval, export.INTERVAL_COLUMNS,
+                                StateInterval.started_at, StateInterval.ended_at, name="check-intervals")
+    return _export_response(CheckResult, export.CHECK_COLUMNS, CheckResult.checked_at, name="checks",
+                            schema=CHECKS)
+
+@app.route("/api/export/metrics")
+def api_export_metrics():
+    gate = require_login()
+    if gate:
+        return Response("unauthorized", status=401)
+
+    return _export_response(MetricsSnapshot, export.METRIC_COLUMNS, MetricsSnapshot.checked_at, name="metrics",
+                            schema=METRICS)
+
+@app.route("/api/logs/<slug>")
+def api_logs(slug: str):
+    gate = require_login()
+    if gate:
+        return Response("unauthorized", status=401)
+
+    svc = Service.query.filter_by(slug=slug).first_or_404()
+    container = svc.dozzle_container or svc.beszel_container
+    if not (Settings.DOZZLE_BASE_URL and container):
+        return jsonify({"error": "no dozzle container configured"}), 404
+
+    # The stream route takes Dozzle's host and container ids; names are looked up,
+    # anything Dozzle doesn't list is passed through as configured
+    host, container = dozzle_dir.lookup(container) or (Settings.DOZZLE_HOST, container)
+    path = Settings.DOZZLE_STREAM_PATH.format(host=host, container=container)
+    upstream = Settings.DOZZLE_BASE_URL + path
+    backlog = max(0, min(request.args.get("backlog", 100, type=int), Settings.LOG_TAIL_LINES))
+
+    # One upstream per container no matter how many tabs are watching it
+    gen = log_tails.stream(container, upstream, backlog=backlog,
+                           max_lines=Settings.LOG_TAIL_MAX_STREAM_LINES)
+    resp = Response(stream_with_context(gen), mimetype="text/event-stream")
+    resp.headers["Cache-Control"] = "no-cache"
+    resp.headers["X-Accel-Buffering"] = "no"
+    return resp
+
+# -------- Profiling (admin only) --------
+@app.route("/api/profiling", methods=["GET", "POST"])
+def api_profiling():
+    gate = require_login()
+    if gate:
+        return Response("unauthorized", status=401)
+    if not _is_admin():
+        return jsonify({"error": "admin only"}), 403
+
+    if request.method == "POST":
+        data = request.get_json(force=True, silent=True) or {}
+        try:
+            sample_rate = float(data["sample_rate"]) if data.get("sample_rate") is not None else None
+            duration = int(data["duration_seconds"]) if data.get("duration_seconds") else None
+        except (TypeError, ValueError):
+            return jsonify({"error": "sample_rate must be a number, duration_seconds an integer"}), 400
+        profiler.configure(enabled=bool(data.get("enabled")), sample_rate=sample_rate, duration=duration)
+
+    return jsonify({**profiler.state(), "profiles": profiler.profiles()})
+
+@app.route("/api/profiling/<profile_id>.<fmt>")
+def api_profiling_download(profile_id: str, fmt: str):
+    gate = require_login()
+    if gate:
+        return Response("unauthorized", status=401)
+    if not _is_admin():
+        abort(403)
+
+    if fmt not in ("pstats", "collapsed"):
+        abort(404)
+    doc = profiler.load(profile_id)
+    if doc is None:
+        abort(404)
+    if fmt == "pstats":
+        resp = Response(pstats_dump(doc), mimetype="application/octet-stream")
+        resp.headers["Content-Disposition"] = f'attachment; filename="{profile_id}.pstats"'
+    else:
+        resp = Response(collapsed(doc), mimetype="text/plain")
+        resp.headers["Content-Disposition"] = f'attachment; filename="{profile_id}.folded"'
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+# -------- Background polling (APIs fall back to polling inline if this stalls) --------
 sched = BackgroundScheduler(daemon=True)
 
 def _poll_health_job():
+    # Only the snapshot writer polls; other workers just read what it publishes
+    if not snapshot.try_acquire_writer():
+        return
     with app.app_context():
-        # hit internal logic once; this persists results
         try:
-            app.test_client().get("/api/health")
+            profiler.call("poll_health", rounds.do, "health", _health_round)
         except Exception:
-            pass
+            db.session.rollback()
 
 def _poll_metrics_job():
+    if not snapshot.try_acquire_writer():
+        return
     with app.app_context():
         try:
-            app.test_client().get("/api/metrics")
+            profiler.call("poll_metrics", rounds.do, "metrics", _metrics_round)
         except Exception:
-            pass
+            db.session.rollback()
 
-sched.add_job(_poll_health_job, "interval", seconds=Settings.POLL_HEALTH_SECONDS, id="poll_health", replace_existing=True)
-sched.add_job(_poll_metrics_job, "interval", seconds=Settings.POLL_METRICS_SECONDS, id="poll_metrics", replace_existing=True)
+def _compact_series_job():
+    # Seals full head files and merges small segments; one worker is plenty
+    if not snapshot.try_acquire_writer():
+        return
+    history.series.compact()
+
+# First rounds run right away so a restored (stale) snapshot is replaced quickly
+sched.add_job(_poll_health_job, "interval", seconds=Settings.POLL_HEALTH_SECONDS, id="poll_health",
+              replace_existing=True, next_run_time=datetime.now())
+sched.add_job(_poll_metrics_job, "interval", seconds=Settings.POLL_METRICS_SECONDS, id="poll_metrics",
+              replace_existing=True, next_run_time=datetime.now())
+if history.series is not None:
+    sched.add_job(_compact_series_job, "interval", seconds=Settings.SERIES_COMPACT_SECONDS,
+                  id="compact_series", replace_existing=True)
+
+# Workers pick up profiling switched on/off through another worker
+sched.add_job(profiler.reload, "interval", seconds=5, id="profiler_reload", replace_existing=True)
 sched.start()
 
 if __name__ == "__main__":